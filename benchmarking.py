@@ -43,11 +43,19 @@ def random_solved_endgame(k):
     return endgame(fname, k)
 
 
-def run_shootme_seed(seed, fast=False):
-    cmd = ["./bin/KlondikeSolver", "/G", str(seed), "/R", "/DC", "3", "/MOVES"]
+SHOOTME_BIN = "./bin/KlondikeSolver"
+
+
+def run_shootme_seed(seed, fast=False, timeout=None, binary=SHOOTME_BIN):
+    """
+    Runs ShootMe on `seed` and returns its output.
+    Raises subprocess.TimeoutExpired after `timeout` seconds (the solver is killed).
+    """
+    cmd = [binary, "/G", str(seed), "/R", "/DC", "3", "/MOVES"]
     if fast:
         cmd.append("/FAST")
-    data = subprocess.run(cmd, stdout=subprocess.PIPE).stdout.decode("utf-8")
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, timeout=timeout)
+    data = proc.stdout.decode("utf-8")
     return data
 
 
@@ -108,7 +116,14 @@ def parse_impossible(ret):
     }
 
 
-def state_with_moveseq(fname):
+def state_with_moveseq(fname, corpus=None):
+    """
+    fname: path to a shootme solution, or its seed when reading from `corpus`
+    (a corpus.Corpus) instead of the text file
+    """
+    if corpus is not None:
+        entry = corpus[fname]
+        return entry.state, list(entry.moves)
     with open(fname) as f:
         ret = f.read()
     solvjson = convert_shootme_to_solvitaire_json(ret)
@@ -117,13 +132,13 @@ def state_with_moveseq(fname):
     return state, moveseq
 
 
-def endgame(fname, k):
+def endgame(fname, k, corpus=None):
     """
-    fname: path to a shootme solution fixture
+    fname: path to a shootme solution fixture (or its seed, with `corpus`)
     k: number of moves *remaining* until shootme solution
     :returns: {KlonState}
     """
-    state, moveseq = state_with_moveseq(fname)
+    state, moveseq = state_with_moveseq(fname, corpus)
     while len(moveseq) > k:
         state = play_move(state, moveseq.pop(0))
     return state
@@ -142,9 +157,13 @@ def solve_state(ret):
         return "Unknown"
 
 
-def clf_seeds(seedlist):
+def clf_seeds(seedlist, corpus=None):
+    """ pass a corpus.Corpus to read the packed results instead of the text files """
     results = defaultdict(set)
     for seed in seedlist:
+        if corpus is not None:
+            results[corpus.classification(seed)].add(seed)
+            continue
         with open(f"./bench/shootme/{seed}") as f:
             ret = f.read()
             result = solve_state(ret)
@@ -168,8 +187,11 @@ def get_state(ret):
     return init_from_solvitaire(deck_json)
 
 
-def map_seeds_to_states(seed_seq):
+def map_seeds_to_states(seed_seq, corpus=None):
     for seed in seed_seq:
+        if corpus is not None:
+            yield seed, corpus.state(seed)
+            continue
         with open(f"./bench/shootme/{seed}") as f:
             ret = f.read()
             state = get_state(ret)
@@ -183,3 +205,25 @@ def get_training_games():
     all_solutions = get_all_solutions()
     training_games = map_seeds_to_states(all_solutions)
     return training_games
+
+
+def get_seeds(fname):
+    with open(fname) as f:
+        return [int(s) for s in f.read().split()]
+
+
+def get_suite_files(size):
+    pref = f"./bench/suites/{size}/"
+    ls = sorted(os.listdir(pref))
+    if len(ls) == 0:
+        raise Exception(f"no suite files in {pref}")
+    return [os.path.join(pref, f) for f in ls]
+
+
+def git_revision():
+    proc = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    return proc.stdout.decode("ascii").strip() or None
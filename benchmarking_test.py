@@ -1,8 +1,10 @@
 import os
+import glob
 import pytest
 import unittest
 from tuplestate import *
 from benchmarking import *
+from gamestate import shootme_deal
 
 
 @pytest.mark.skipif(os.environ.get("GITHUB_ACTION") != None, reason="In CI environment")
@@ -40,3 +42,18 @@ class TestInterop(unittest.TestCase):
         assert state[TABLEAU5][-1] == "AC"
         assert state[TABLEAU6][-1] == "5C"
         assert state[TABLEAU7][-1] == "JH"
+
+
+class TestShootMeDeals(unittest.TestCase):
+    def test_generated_deals_match_fixtures(self):
+        for path in glob.glob("./fixtures/shootme/*/*.txt"):
+            seed = int(os.path.basename(path).split(".")[0])
+            assert shootme_deal(seed) == filename_to_klonstate(path), seed
+
+
+class TestStarImport(unittest.TestCase):
+    def test_leaves_modules_alone(self):
+        # scripts do `import datetime` and then `from benchmarking import *`
+        scope = {}
+        exec("import datetime\nfrom benchmarking import *", scope)
+        assert scope["datetime"].datetime.now()
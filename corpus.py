@@ -0,0 +1,169 @@
+"""
+Single-file corpus of ShootMe results.
+
+`pack_corpus` converts a directory of ShootMe outputs (one file per seed, as
+harvested into `bench/shootme/`) into one binary file; `Corpus` memory-maps
+it and gives random access by seed without reading or parsing the text.
+
+Layout: a header, then one fixed-size record per seed (sorted by seed), then
+a blob with the solution move lines the records point into.
+"""
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from benchmarking import get_state, parse_winnable, solve_state, took_time
+from gamestate import pack_state, packed_from_bytes
+
+MAGIC = b"KLONCORP"
+VERSION = 1
+PACKED_SIZE = 66  # PackedState.to_bytes()
+
+CLASSIFICATIONS = ("Solved-Min", "Solved", "Impossible", "Unknown")
+
+HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("count", "<u4")])
+RECORD = np.dtype(
+    [
+        ("seed", "<u4"),
+        ("clf", "u1"),
+        ("move_count", "<u2"),
+        ("time_ms", "<u8"),
+        ("moves_offset", "<u8"),
+        ("moves_len", "<u4"),
+        ("deal", "u1", (PACKED_SIZE,)),
+    ]
+)
+
+CorpusEntry = namedtuple(
+    "CorpusEntry", ["seed", "classification", "move_count", "time_ms", "state", "moves"]
+)
+
+
+def parse_result(ret):
+    """ (classification, move count, time in ms, move line) of a ShootMe output """
+    clf = solve_state(ret)
+    if clf in ("Solved-Min", "Solved"):
+        parsed = parse_winnable(ret)
+        return clf, parsed["move_count"], parsed["time_ms"], parsed["moves"].strip()
+    ms = int(took_time.match(ret.splitlines()[15]).groups()[0])
+    return clf, 0, ms, ""
+
+
+def seed_files(src_dir):
+    """ (seed, path) of every ShootMe output below `src_dir`, named by seed """
+    for root, _, files in os.walk(src_dir):
+        for fname in files:
+            stem = fname.split(".")[0]
+            if stem.isdigit():
+                yield int(stem), os.path.join(root, fname)
+
+
+def pack_corpus(src_dir="./bench/shootme", dest="./bench/shootme.corpus"):
+    """
+    Packs every ShootMe output below `src_dir` into the corpus file `dest`.
+    Returns the number of seeds packed.
+    """
+    files = sorted(seed_files(src_dir))
+    records = np.zeros(len(files), dtype=RECORD)
+    blob = bytearray()
+    for i, (seed, path) in enumerate(files):
+        if i > 0 and files[i - 1][0] == seed:
+            raise ValueError(f"seed {seed} appears more than once in {src_dir}")
+        with open(path) as f:
+            ret = f.read()
+        clf, move_count, ms, moves = parse_result(ret)
+        moves = moves.encode("ascii")
+        rec = records[i]
+        rec["seed"] = seed
+        rec["clf"] = CLASSIFICATIONS.index(clf)
+        rec["move_count"] = move_count
+        rec["time_ms"] = ms
+        rec["moves_offset"] = len(blob)
+        rec["moves_len"] = len(moves)
+        rec["deal"] = np.frombuffer(pack_state(get_state(ret)).to_bytes(), np.uint8)
+        blob += moves
+    header = np.array([(MAGIC, VERSION, len(files))], dtype=HEADER)
+    tmp = f"{dest}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header.tobytes())
+        f.write(records.tobytes())
+        f.write(bytes(blob))
+    os.replace(tmp, dest)
+    return len(files)
+
+
+class Corpus:
+    """
+    Read-only, memory-mapped view of a packed corpus.
+
+    `corpus[seed]` gives a CorpusEntry; `seed in corpus`, `len(corpus)` and
+    iteration (in seed order) work as for a dict of entries.
+    """
+
+    def __init__(self, path="./bench/shootme.corpus"):
+        self._mm = np.memmap(path, dtype=np.uint8, mode="r")
+        header = self._mm[: HEADER.itemsize].view(HEADER)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} corpus")
+        count = int(header["count"])
+        end = HEADER.itemsize + count * RECORD.itemsize
+        self.records = self._mm[HEADER.itemsize : end].view(RECORD)
+        self._blob = self._mm[end:]
+
+    def __len__(self):
+        return len(self.records)
+
+    def _index(self, seed):
+        i = np.searchsorted(self.records["seed"], seed)
+        if i < len(self.records) and self.records["seed"][i] == seed:
+            return i
+        return -1
+
+    def __contains__(self, seed):
+        return self._index(int(seed)) >= 0
+
+    def __getitem__(self, seed):
+        i = self._index(int(seed))
+        if i < 0:
+            raise KeyError(seed)
+        return self._entry(self.records[i])
+
+    def __iter__(self):
+        return (self._entry(rec) for rec in self.records)
+
+    def _entry(self, rec):
+        start = int(rec["moves_offset"])
+        moves = bytes(self._blob[start : start + int(rec["moves_len"])]).decode("ascii")
+        return CorpusEntry(
+            seed=int(rec["seed"]),
+            classification=CLASSIFICATIONS[rec["clf"]],
+            move_count=int(rec["move_count"]),
+            time_ms=int(rec["time_ms"]),
+            state=packed_from_bytes(rec["deal"].tobytes()).to_klonstate(),
+            moves=moves.split(" ") if moves else [],
+        )
+
+    def seeds(self, classification=None):
+        """ all seeds, or the seeds with the given classification """
+        seeds = self.records["seed"]
+        if classification is not None:
+            seeds = seeds[self.records["clf"] == CLASSIFICATIONS.index(classification)]
+        return [int(s) for s in seeds]
+
+    def classification(self, seed):
+        i = self._index(int(seed))
+        if i < 0:
+            raise KeyError(seed)
+        return CLASSIFICATIONS[self.records["clf"][i]]
+
+    def state(self, seed):
+        return self[seed].state
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else "./bench/shootme"
+    dest = sys.argv[2] if len(sys.argv) > 2 else "./bench/shootme.corpus"
+    n = pack_corpus(src, dest)
+    print(f"packed {n:,} seeds into {dest}")
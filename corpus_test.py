@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from corpus import *
+from benchmarking import (
+    clf_seeds,
+    endgame,
+    filename_to_klonstate,
+    map_seeds_to_states,
+    state_with_moveseq,
+)
+
+
+FIXTURES = "./fixtures/shootme"
+
+
+class TestCorpus(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmpdir.name, "shootme.corpus")
+        cls.count = pack_corpus(FIXTURES, cls.path)
+        cls.corpus = Corpus(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.corpus
+        cls.tmpdir.cleanup()
+
+    def test_packs_every_fixture(self):
+        assert self.count == len(list(seed_files(FIXTURES)))
+        assert len(self.corpus) == self.count
+        assert self.corpus.seeds() == sorted(self.corpus.seeds())
+
+    def test_solved_entry_matches_text(self):
+        entry = self.corpus[12]
+        state, moveseq = state_with_moveseq(f"{FIXTURES}/solvedmin/12.txt")
+        assert entry.classification == "Solved-Min"
+        assert entry.move_count == 116
+        assert entry.time_ms == 5278896
+        assert entry.state == state
+        assert entry.moves == moveseq
+
+    def test_unsolved_entries(self):
+        entry = self.corpus[2591]
+        assert entry.classification == "Impossible"
+        assert entry.time_ms == 288379
+        assert entry.moves == []
+        assert 2591 in self.corpus.seeds("Impossible")
+        assert 2591 not in self.corpus.seeds("Solved")
+
+    def test_states_match_fixtures(self):
+        for seed, path in seed_files(FIXTURES):
+            assert self.corpus.state(seed) == filename_to_klonstate(path)
+
+    def test_missing_seed(self):
+        assert 12 in self.corpus
+        assert 999_999 not in self.corpus
+        with self.assertRaises(KeyError):
+            self.corpus[999_999]
+
+    def test_benchmarking_helpers(self):
+        seeds = self.corpus.seeds()
+        clfs = clf_seeds(seeds, corpus=self.corpus)
+        assert 12 in clfs["Solved-Min"]
+        assert sum(len(s) for s in clfs.values()) == len(seeds)
+        (seed, state), = map_seeds_to_states([12], corpus=self.corpus)
+        assert state == self.corpus[12].state
+
+    def test_moveseq_from_corpus(self):
+        path = f"{FIXTURES}/solved/49.txt"
+        assert state_with_moveseq(49, corpus=self.corpus) == state_with_moveseq(path)
+        assert endgame(49, 10, corpus=self.corpus) == endgame(path, 10)
+
+    def test_rejects_other_files(self):
+        path = os.path.join(self.tmpdir.name, "junk")
+        with open(path, "wb") as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            Corpus(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -31,11 +31,15 @@ from tuplestate import *
 from gamestate import *
 from benchmarking import *
 from vectorize import *
+from corpus import Corpus
 random.seed(0)
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 print('cuda?', device)
 
+# the ShootMe results, packed by `python corpus.py`
+corpus = Corpus("./bench/shootme.corpus")
+
 
 def solve_state(ret):
     lines = ret.splitlines()
@@ -52,10 +56,7 @@ def solve_state(ret):
 def clf_seeds(seedlist):
     results = defaultdict(set)
     for seed in seedlist:
-        with open(f"./bench/shootme/{seed}") as f:
-            ret = f.read()
-            result = solve_state(ret)
-            results[result].add(seed)
+        results[corpus.classification(seed)].add(seed)
     return results
 
 def clf_summary(seedlist):
@@ -74,15 +75,11 @@ def get_state(ret):
 
 def map_seeds_to_states(seed_seq):
     for seed in seed_seq:
-        with open(f"./bench/shootme/{seed}") as f:
-            ret = f.read()
-            state = get_state(ret)
-            yield seed, state
+        yield seed, corpus.state(seed)
 
 
-results = defaultdict(set)
-all_solutions = os.listdir('./bench/shootme/')
-seeds = list(map(lambda fname: int(fname[:-4]), all_solutions))
+all_solutions = corpus.seeds()
+seeds = all_solutions
 
 def solve_state(ret):
     lines = ret.splitlines()
@@ -96,12 +93,8 @@ def solve_state(ret):
     elif result.startswith('Unknown'):
         return "Unknown"
 
-for seed in sorted(seeds):
-    with open(f"bench/shootme/{seed}.txt") as f:
-        ret = f.read()
-        result = solve_state(ret)
-        results[result].add(seed)
-    
+results = clf_seeds(sorted(seeds))
+
 seed_class = {}
 for cls in results.keys():
     seeds_cls = results[cls]
@@ -214,28 +207,13 @@ resultfile = f"solve_results/{datestr}_mymodel-policy-201912132128-gamma-0.5.jso
 ######### BENCHMARKING CODE
 def map_seeds_to_states(seed_seq):
     for seed in seed_seq:
-        with open(f"bench/shootme/{seed}.txt") as f:
-            ret = f.read()
-            state = get_state(ret)
-            yield seed, state
-
-def get_seeds(fname):
-    with open(fname) as f:
-        return map(int, f.read().strip().split(' '))
-    
-    
+        yield seed, corpus.state(seed)
+
+# get_seeds and get_suite_files come from benchmarking
 def get_suite_states(fname):
     return list(map_seeds_to_states(get_seeds(fname)))
 
 
-def get_suite_files(size):
-    pref = f'./bench/suites/{size}/'
-    ls = sorted(os.listdir(pref))
-    if len(ls) == 0:
-        raise Exception(f"no suite files in {pref}")
-    return [os.path.join(pref, f) for f in ls]
-
-
 Result = namedtuple('Result', 
     ['seed', 'time', 
      'solved', 'visited', 'msg',
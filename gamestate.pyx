@@ -1,6 +1,10 @@
 # cython: language_level=3, c_string_type=bytes, c_string_encoding=ascii
 cimport cython
-from collections import namedtuple
+from libc.string cimport memcpy, memmove, memcmp, memset
+from cpython.mem cimport PyMem_Malloc, PyMem_Realloc, PyMem_Free
+from posix.time cimport clock_gettime, timespec, CLOCK_MONOTONIC
+from collections import OrderedDict, namedtuple
+import time
 
 
 KlonState = namedtuple(
@@ -44,6 +48,498 @@ DEF SUIT = 1
 
 cdef int[4] FNDS = [FOUNDATION_C, FOUNDATION_D, FOUNDATION_S, FOUNDATION_H]
 
+RANKS = "A23456789TJQK"
+
+
+### PACKED STATES
+
+DEF NUM_CARDS = 52
+DEF FACE_DOWN = 64     # flag bit on a packed card which is face-down
+DEF CARD_MASK = 63
+DEF TALON = 0          # packed segment holding both the stock and the waste
+DEF NUM_SEGMENTS = 12  # talon, seven tableaus, four foundations
+
+cdef struct Klon:
+    # every card of the game, pile after pile: talon, tableau 1-7, fnd C/D/S/H
+    # a card is suit * 13 + rank (suits in CDSH order, ranks A..K) | FACE_DOWN
+    unsigned char cards[NUM_CARDS]
+    # segment `seg` is cards[start[seg]:start[seg + 1]]
+    unsigned char start[NUM_SEGMENTS + 1]
+    # the talon is the stock followed by the reversed waste: drawing and
+    # recycling the stock never reorders it, they only move this split point.
+    # cards[:split] is the stock, cards[split] is the top of the waste.
+    unsigned char split
+    # Zobrist hash of the above, kept up to date by every klon_* operation
+    unsigned long long hash
+
+cdef int[NUM_SEGMENTS] SEG_CAPACITY = [24, 19, 19, 19, 19, 19, 19, 19, 13, 13, 13, 13]
+
+# card strings indexed by packed card, and the reverse mapping
+CARD_STRINGS = [None] * (FACE_DOWN + NUM_CARDS)
+for _card in range(NUM_CARDS):
+    CARD_STRINGS[_card] = RANKS[_card % 13] + FND_SUITS[_card // 13]
+    CARD_STRINGS[_card | FACE_DOWN] = CARD_STRINGS[_card].lower()
+CARD_CODES = {c: i for i, c in enumerate(CARD_STRINGS) if c is not None}
+
+
+### Zobrist keys: one per (pile position, card) and one per talon split.
+# Talon positions count along the (never reordered) talon, so drawing
+# and recycling the stock only swap a split key.
+
+DEF NUM_SLOTS = 209  # sum of SEG_CAPACITY
+
+cdef unsigned long long ZOBRIST[NUM_SLOTS][2 * NUM_CARDS]
+cdef unsigned long long SPLIT_KEYS[25]
+cdef int SEG_BASE[NUM_SEGMENTS]
+
+
+cdef unsigned long long splitmix64(unsigned long long* x):
+    cdef unsigned long long z
+    x[0] += 0x9E3779B97F4A7C15ULL
+    z = x[0]
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL
+    return z ^ (z >> 31)
+
+
+cdef void init_zobrist():
+    # fixed seed: hashes must agree between processes and runs
+    cdef unsigned long long x = 20191028
+    cdef int seg, slot, card, base = 0
+    for seg in range(NUM_SEGMENTS):
+        SEG_BASE[seg] = base
+        base += SEG_CAPACITY[seg]
+    for slot in range(NUM_SLOTS):
+        for card in range(2 * NUM_CARDS):
+            ZOBRIST[slot][card] = splitmix64(&x)
+    for slot in range(25):
+        SPLIT_KEYS[slot] = splitmix64(&x)
+
+
+init_zobrist()
+
+
+cdef inline unsigned long long card_key(int seg, int rel, unsigned char card):
+    """ key for `card` at position `rel` of segment `seg` """
+    cdef int idx = card & CARD_MASK
+    if card & FACE_DOWN:
+        idx += NUM_CARDS
+    return ZOBRIST[SEG_BASE[seg] + rel][idx]
+
+
+cdef unsigned long long klon_full_hash(Klon* k):
+    cdef unsigned long long h = SPLIT_KEYS[k.split]
+    cdef int seg, i
+    for seg in range(NUM_SEGMENTS):
+        for i in range(k.start[seg], k.start[seg + 1]):
+            h ^= card_key(seg, i - k.start[seg], k.cards[i])
+    return h
+
+
+cdef inline int pile_segment(int pile):
+    if pile == STOCK or pile == WASTE:
+        return TALON
+    if pile >= FOUNDATION_C:
+        return pile - 1
+    return pile
+
+
+cdef inline int seg_len(Klon* k, int seg):
+    return k.start[seg + 1] - k.start[seg]
+
+
+cdef inline int packed_rank(unsigned char card):
+    return (card & CARD_MASK) % 13
+
+
+cdef inline int packed_suit(unsigned char card):
+    return (card & CARD_MASK) // 13
+
+
+cdef inline int packed_can_stack(unsigned char card, unsigned char onto):
+    """ `card` is one lower than `onto` and of the other colour """
+    if packed_rank(card) + 1 != packed_rank(onto):
+        return 0
+    return (packed_suit(card) & 1) != (packed_suit(onto) & 1)
+
+
+cdef int packed_count_face_up(Klon* k, int seg):
+    cdef int i = k.start[seg + 1] - 1
+    cdef int count = 0
+    while i >= k.start[seg] and not (k.cards[i] & FACE_DOWN):
+        count += 1
+        i -= 1
+    return count
+
+
+cdef void klon_remove(Klon* k, int pos, int n, int seg):
+    """ delete cards[pos:pos+n] which belong to segment `seg` """
+    cdef int i
+    memmove(&k.cards[pos], &k.cards[pos + n], k.start[NUM_SEGMENTS] - pos - n)
+    for i in range(seg + 1, NUM_SEGMENTS + 1):
+        k.start[i] -= n
+
+
+cdef void klon_insert(Klon* k, int pos, int n, int seg):
+    """ open a gap of n cards at `pos` inside segment `seg` """
+    cdef int i
+    memmove(&k.cards[pos + n], &k.cards[pos], k.start[NUM_SEGMENTS] - pos)
+    for i in range(seg + 1, NUM_SEGMENTS + 1):
+        k.start[i] += n
+
+
+cdef inline void hash_cards(Klon* k, int seg, int lo, int hi):
+    """ toggle the hash keys of cards[lo:hi], which lie in segment `seg` """
+    cdef int i
+    for i in range(lo, hi):
+        k.hash ^= card_key(seg, i - k.start[seg], k.cards[i])
+
+
+cdef inline void klon_turn_up(Klon* k, int seg, int pos):
+    cdef unsigned char card = k.cards[pos]
+    cdef int rel = pos - k.start[seg]
+    if card & FACE_DOWN:
+        k.hash ^= card_key(seg, rel, card) ^ card_key(seg, rel, card & CARD_MASK)
+        k.cards[pos] = card & CARD_MASK
+
+
+cdef inline void klon_set_split(Klon* k, int split):
+    k.hash ^= SPLIT_KEYS[k.split] ^ SPLIT_KEYS[split]
+    k.split = split
+
+
+cdef int klon_take(Klon* k, int pile, int n, unsigned char* buf) except -1:
+    """
+    Remove the top n cards of `pile` into buf (bottom card first)
+    and turn the new top card of the pile face-up
+    """
+    cdef int i, pos, seg = pile_segment(pile)
+    if pile == STOCK or pile == WASTE:
+        if pile == STOCK and n > k.split:
+            raise ValueError(f"cannot take {n} cards from the stock")
+        if pile == WASTE and n > k.start[1] - k.split:
+            raise ValueError(f"cannot take {n} cards from the waste")
+        pos = k.split - n if pile == STOCK else k.split
+        # the talon cards above the removed ones shift down
+        hash_cards(k, TALON, pos, k.start[1])
+        for i in range(n):
+            buf[i] = k.cards[pos + i] if pile == STOCK else k.cards[pos + n - 1 - i]
+        klon_remove(k, pos, n, seg)
+        hash_cards(k, TALON, pos, k.start[1])
+        if pile == STOCK:
+            klon_set_split(k, pos)
+            if k.split > 0:
+                klon_turn_up(k, TALON, k.split - 1)
+        elif k.split < k.start[1]:
+            klon_turn_up(k, TALON, k.split)
+    else:
+        if n > seg_len(k, seg):
+            raise ValueError(f"cannot take {n} cards from pile {pile}")
+        pos = k.start[seg + 1] - n
+        hash_cards(k, seg, pos, pos + n)
+        memcpy(buf, &k.cards[pos], n)
+        klon_remove(k, pos, n, seg)
+        if seg_len(k, seg) > 0:
+            klon_turn_up(k, seg, pos - 1)
+    return 0
+
+
+cdef int klon_put(Klon* k, int pile, int n, unsigned char* buf) except -1:
+    """ Place n cards from buf (bottom card first) on top of `pile` """
+    cdef int i, pos, seg = pile_segment(pile)
+    if seg_len(k, seg) + n > SEG_CAPACITY[seg]:
+        raise ValueError(f"pile {pile} cannot hold {n} more cards")
+    if pile == STOCK or pile == WASTE:
+        pos = k.split
+        hash_cards(k, TALON, pos, k.start[1])
+        klon_insert(k, pos, n, seg)
+        for i in range(n):
+            k.cards[pos + i] = buf[i] if pile == STOCK else buf[n - 1 - i]
+        hash_cards(k, TALON, pos, k.start[1])
+        if pile == STOCK:
+            klon_set_split(k, pos + n)
+    else:
+        pos = k.start[seg + 1]
+        klon_insert(k, pos, n, seg)
+        memcpy(&k.cards[pos], buf, n)
+        hash_cards(k, seg, pos, pos + n)
+    return 0
+
+
+cdef int klon_move(Klon* k, int src_pile, int dest_pile, int n) except -1:
+    cdef unsigned char buf[NUM_CARDS]
+    klon_take(k, src_pile, n, buf)
+    klon_put(k, dest_pile, n, buf)
+    return 0
+
+
+cdef inline void klon_draw(Klon* k):
+    # the top (up to) three stock cards become the top of the waste
+    klon_set_split(k, k.split - min(3, k.split))
+
+
+cdef inline void klon_replace_stock(Klon* k):
+    # the waste, turned over, becomes the stock
+    klon_set_split(k, k.start[1])
+
+
+### DRAW CYCLES
+# Drawing and turning over the waste never reorders the talon, they only
+# move the split between stock and waste. Where the split ends up after n
+# draws (turning the waste over whenever the stock runs out) depends only
+# on the talon length and the current split, so it is tabulated once.
+
+DEF MAX_TALON = 24  # SEG_CAPACITY[TALON]
+DEF MAX_DRAW = 15   # the most distinct waste tops a talon ever offers
+
+# DRAW_SPLIT[talon length][split][n]: the split after n draws
+cdef unsigned char DRAW_SPLIT[MAX_TALON + 1][MAX_TALON + 1][MAX_DRAW + 1]
+# DRAW_MOVES[talon length][split]: number of useful draw moves, DR1 ... DRn
+cdef unsigned char DRAW_MOVES[MAX_TALON + 1][MAX_TALON + 1]
+
+
+cdef void init_draw_cycles():
+    cdef int talon_len, split, s, n, moves
+    for talon_len in range(MAX_TALON + 1):
+        for split in range(talon_len + 1):
+            s = split
+            moves = 0
+            # the current waste top is reachable without drawing
+            seen = {s} if s < talon_len else set()
+            DRAW_SPLIT[talon_len][split][0] = s
+            for n in range(1, MAX_DRAW + 2):
+                if talon_len > 0:
+                    if s == 0:
+                        s = talon_len
+                    s -= min(3, s)
+                if n <= MAX_DRAW:
+                    DRAW_SPLIT[talon_len][split][n] = s
+                if moves == n - 1 and talon_len > 0 and s not in seen:
+                    seen.add(s)
+                    moves = n
+            assert moves <= MAX_DRAW, "MAX_DRAW is too small"
+            DRAW_MOVES[talon_len][split] = moves
+
+
+init_draw_cycles()
+
+
+cdef inline int draw_split(int talon_len, int split, int n) except -1:
+    """ the split after drawing n times """
+    if talon_len > MAX_TALON:
+        raise ValueError(f"talon of {talon_len} cards is too large")
+    while n > MAX_DRAW:
+        split = DRAW_SPLIT[talon_len][split][MAX_DRAW]
+        n -= MAX_DRAW
+    return DRAW_SPLIT[talon_len][split][n]
+
+
+cdef inline int klon_draw_n(Klon* k, int n) except -1:
+    klon_set_split(k, draw_split(k.start[1], k.split, n))
+    return 0
+
+
+cdef class PackedState:
+    """
+    Immutable, compact equivalent of a KlonState.
+
+    Supports read access like a KlonState (`state.waste`, `state[TABLEAU3]`,
+    iterating over the piles), producing the usual tuples of card strings.
+    """
+    cdef Klon k
+
+    def to_klonstate(self):
+        return KlonState(*self)
+
+    def to_bytes(self):
+        cdef bytes header = bytes([self.k.start[i] for i in range(NUM_SEGMENTS + 1)])
+        return header + bytes([self.k.split]) + (<char*>self.k.cards)[:NUM_CARDS]
+
+    @staticmethod
+    def from_bytes(data):
+        return packed_from_bytes(data)
+
+    def pile(self, int pile_idx):
+        """ the cards of `pile_idx` (as KlonState indexes its piles) """
+        cdef int i, seg
+        cdef Klon* k = &self.k
+        if pile_idx == STOCK:
+            return tuple([CARD_STRINGS[k.cards[i]] for i in range(k.split)])
+        if pile_idx == WASTE:
+            return tuple(
+                [CARD_STRINGS[k.cards[i]] for i in range(k.start[1] - 1, k.split - 1, -1)]
+            )
+        if pile_idx < 0 or pile_idx > FOUNDATION_H:
+            raise IndexError("pile index out of range")
+        seg = pile_segment(pile_idx)
+        return tuple(
+            [CARD_STRINGS[k.cards[i]] for i in range(k.start[seg], k.start[seg + 1])]
+        )
+
+    def __getitem__(self, pile_idx):
+        if isinstance(pile_idx, slice):
+            return tuple(self)[pile_idx]
+        if pile_idx < 0:
+            pile_idx += len(KlonState._fields)
+        return self.pile(pile_idx)
+
+    def __len__(self):
+        return len(KlonState._fields)
+
+    def __iter__(self):
+        for pile_idx in range(len(KlonState._fields)):
+            yield self.pile(pile_idx)
+
+    @property
+    def stock(self):
+        return self.pile(STOCK)
+
+    @property
+    def tableau1(self):
+        return self.pile(TABLEAU1)
+
+    @property
+    def tableau2(self):
+        return self.pile(TABLEAU2)
+
+    @property
+    def tableau3(self):
+        return self.pile(TABLEAU3)
+
+    @property
+    def tableau4(self):
+        return self.pile(TABLEAU4)
+
+    @property
+    def tableau5(self):
+        return self.pile(TABLEAU5)
+
+    @property
+    def tableau6(self):
+        return self.pile(TABLEAU6)
+
+    @property
+    def tableau7(self):
+        return self.pile(TABLEAU7)
+
+    @property
+    def waste(self):
+        return self.pile(WASTE)
+
+    @property
+    def foundation1(self):
+        return self.pile(FOUNDATION_C)
+
+    @property
+    def foundation2(self):
+        return self.pile(FOUNDATION_D)
+
+    @property
+    def foundation3(self):
+        return self.pile(FOUNDATION_S)
+
+    @property
+    def foundation4(self):
+        return self.pile(FOUNDATION_H)
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedState):
+            return NotImplemented
+        return packed_equal(&self.k, &(<PackedState>other).k)
+
+    def __ne__(self, other):
+        if not isinstance(other, PackedState):
+            return NotImplemented
+        return not packed_equal(&self.k, &(<PackedState>other).k)
+
+    @property
+    def zhash(self):
+        """ 64-bit Zobrist hash, updated incrementally by every move """
+        return self.k.hash
+
+    def __hash__(self):
+        return <long long>self.k.hash
+
+    def __reduce__(self):
+        return (packed_from_bytes, (self.to_bytes(),))
+
+    def __repr__(self):
+        piles = ", ".join(f"{f}={p!r}" for f, p in zip(KlonState._fields, self))
+        return f"PackedState({piles})"
+
+
+cdef inline PackedState new_packed(Klon* k):
+    cdef PackedState packed = PackedState.__new__(PackedState)
+    packed.k = k[0]
+    return packed
+
+
+cdef int packed_equal(Klon* a, Klon* b):
+    if a.split != b.split:
+        return 0
+    if memcmp(a.start, b.start, NUM_SEGMENTS + 1) != 0:
+        return 0
+    return memcmp(a.cards, b.cards, a.start[NUM_SEGMENTS]) == 0
+
+
+def packed_from_bytes(data):
+    cdef PackedState packed = PackedState.__new__(PackedState)
+    cdef int i
+    if len(data) != NUM_SEGMENTS + 2 + NUM_CARDS:
+        raise ValueError("not a packed state")
+    for i in range(NUM_SEGMENTS + 1):
+        packed.k.start[i] = data[i]
+    packed.k.split = data[NUM_SEGMENTS + 1]
+    for i in range(NUM_CARDS):
+        packed.k.cards[i] = data[NUM_SEGMENTS + 2 + i]
+    packed.k.hash = klon_full_hash(&packed.k)
+    return packed
+
+
+cpdef PackedState pack_state(state):
+    """ converts a KlonState to a PackedState (lossless) """
+    if type(state) is PackedState:
+        return state
+    if isinstance(state, PackedState):  # snapshot of a SearchState
+        return new_packed(&(<PackedState>state).k)
+    cdef PackedState packed = PackedState.__new__(PackedState)
+    cdef Klon* k = &packed.k
+    cdef int seg, pos = 0
+    talon = tuple(state[STOCK]) + tuple(reversed(state[WASTE]))
+    piles = [talon] + [state[t] for t in range(TABLEAU1, TABLEAU7 + 1)]
+    piles += [state[f] for f in range(FOUNDATION_C, FOUNDATION_H + 1)]
+    for seg, pile in enumerate(piles):
+        if len(pile) > SEG_CAPACITY[seg] or pos + len(pile) > NUM_CARDS:
+            raise ValueError(f"too many cards in pile {pile}")
+        k.start[seg] = pos
+        for card in pile:
+            try:
+                k.cards[pos] = CARD_CODES[card]
+            except KeyError:
+                raise ValueError(f"invalid card {card!r}")
+            pos += 1
+    k.start[NUM_SEGMENTS] = pos
+    k.split = len(state[STOCK])
+    k.hash = klon_full_hash(k)
+    return packed
+
+
+cpdef unsigned long long state_hash(state):
+    """
+    64-bit Zobrist hash of a state. Free for packed states, which carry it;
+    use it to key visited sets and transposition tables.
+    """
+    if isinstance(state, PackedState):
+        return (<PackedState>state).k.hash
+    return pack_state(state).k.hash
+
+
+def unpack_state(state):
+    """ converts a PackedState back to a KlonState """
+    if isinstance(state, PackedState):
+        return state.to_klonstate()
+    return state
+
 
 cpdef irange(int start, int stop):
     """ inclusive range """
@@ -105,26 +601,15 @@ cdef int card_is_king(char* card):
     return cv == KING
 
 
-@cython.boundscheck(False)
 cdef set get_draw_moves(state):
-    if len(state.stock) == 0 and len(state.waste) == 0:
-        return set()
-    st = state
-    draw_moves = set()
-    seen_top_cards = set()
-    if len(st[WASTE]) > 0:
-        seen_top_cards.add(st[WASTE][-3:])  # current waste is available
-    for draw_count in range(100):  # should be way more than enough
-        if len(st[STOCK]) == 0:
-            st = replace_stock(st)
-        st = draw(st)
-        new_move = f"DR{draw_count+1}"
-        top_waste = st[WASTE][-3:]
-        if top_waste in seen_top_cards: # cycled through
-            return draw_moves
-        seen_top_cards.add(top_waste)
-        draw_moves.add(new_move)
-    return draw_moves
+    cdef int split = len(state[STOCK])
+    cdef int talon_len = split + len(state[WASTE])
+    if talon_len > MAX_TALON:
+        raise ValueError(f"talon of {talon_len} cards is too large")
+    return set(DRAW_CODES[:DRAW_MOVES[talon_len][split]])
+
+
+DRAW_CODES = [f"DR{n}" for n in range(1, MAX_DRAW + 1)]
 
 
 @cython.boundscheck(False)
@@ -260,9 +745,1008 @@ cdef foundation_to_tableau(state):
     return moves
 
 
+### SEARCH STATISTICS
+
+# Counters and timers of the native search code, off unless
+# enable_search_stats is called (until then they cost a branch each).
+
+cdef struct Counters:
+    long long states  # states generated by applying a move
+    long long legal_move_calls
+    long long scored_moves
+    long long hash_lookups
+    long long playouts
+    long long playout_moves
+    long long longest_playout
+    double movegen_seconds
+    double scoring_seconds
+    double hashing_seconds
+
+cdef bint collect_stats = False
+cdef Counters counters
+
+SearchStats = namedtuple(
+    "SearchStats",
+    [
+        "states",
+        "legal_move_calls",
+        "scored_moves",
+        "hash_lookups",
+        "playouts",
+        "playout_moves",
+        "longest_playout",
+        "movegen_seconds",
+        "scoring_seconds",
+        "hashing_seconds",
+    ],
+)
+
+
+cdef inline double clock():
+    cdef timespec ts
+    clock_gettime(CLOCK_MONOTONIC, &ts)
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+
+def enable_search_stats():
+    """
+    turns the counters and timers on, resetting them unless they were on
+    already; returns whether they were
+    """
+    global collect_stats, counters
+    cdef bint was_on = collect_stats
+    if not was_on:
+        memset(&counters, 0, sizeof(Counters))
+    collect_stats = True
+    return was_on
+
+
+def disable_search_stats():
+    global collect_stats
+    collect_stats = False
+
+
+def search_stats():
+    """
+    SearchStats since enable_search_stats: states generated, legal move
+    generations, moves scored, visited-table lookups, greedy playouts and
+    the moves they made (in total and in the longest one), and the seconds
+    spent generating, scoring (or ordering) moves and looking up hashes
+    """
+    return SearchStats(**counters)
+
+
+### MOVE IDS
+# Integer move ids index MOVE_CODES. The first 623 entries are exactly
+# `vectorize.all_moves`; longer draws follow (a talon never offers more
+# than MAX_DRAW distinct draw moves).
+
+DEF NUM_MOVES = 628
+DEF T2T_BASE = 0         # "12", "12-10", ... "76-9": 13 ids per (src, dest)
+DEF T2F_BASE = 546       # "1C" ... "7H"
+DEF W2T_BASE = 574       # "W1" ... "W7"
+DEF W2F_BASE = 581       # "WC" ... "WH"
+DEF F2T_BASE = 585       # "C1" ... "H7"
+DEF DRAW_BASE = 613      # "DR1" ... "DR15"
+
+# kinds of moves, in the order of their id ranges
+MOVE_TABLEAU = 0          # tableau to tableau
+MOVE_TO_FOUNDATION = 1    # tableau to foundation
+MOVE_WASTE_TABLEAU = 2
+MOVE_WASTE_FOUNDATION = 3
+MOVE_FOUNDATION_TABLEAU = 4
+MOVE_DRAW = 5
+
+# offset of a tableau move of n cards within its (src, dest) block,
+# following the lexicographic order of the move codes
+cdef int[14] T2T_OFFSET = [0, 0, 5, 6, 7, 8, 9, 10, 11, 12, 1, 2, 3, 4]
+
+cdef unsigned char MOVE_KIND[NUM_MOVES]
+cdef unsigned char MOVE_SRC[NUM_MOVES]    # pile index, as in KlonState
+cdef unsigned char MOVE_DEST[NUM_MOVES]
+cdef unsigned char MOVE_COUNT[NUM_MOVES]  # cards moved, or draws made
+cdef short MOVE_CODE_RANK[NUM_MOVES]      # position of the move code when sorted
+
+
+cdef inline int t2t_id(int src, int dest, int n):
+    cdef int pair = (src - 1) * 6 + (dest - 1 if dest < src else dest - 2)
+    return T2T_BASE + pair * 13 + T2T_OFFSET[n]
+
+
+def generate_move_codes():
+    """ all move codes, in move id order """
+    tabs = range(TABLEAU1, TABLEAU7 + 1)
+    tableau_moves = sorted(
+        f"{src}{dest}" + (f"-{n}" if n > 1 else "")
+        for src in tabs
+        for dest in tabs
+        if src != dest
+        for n in range(1, 14)
+    )
+    return (
+        tableau_moves
+        + [f"{src}{suit}" for src in tabs for suit in FND_SUITS]
+        + [f"W{dest}" for dest in tabs]
+        + [f"W{suit}" for suit in FND_SUITS]
+        + [f"{suit}{dest}" for suit in FND_SUITS for dest in tabs]
+        + DRAW_CODES
+    )
+
+
+MOVE_CODES = generate_move_codes()
+MOVE_IDS = {code: i for i, code in enumerate(MOVE_CODES)}
+assert len(MOVE_CODES) == NUM_MOVES
+
+
+cdef void init_moves():
+    cdef int i, src, dest, n
+    for i, code in enumerate(MOVE_CODES):
+        if code.startswith("DR"):
+            MOVE_KIND[i], MOVE_SRC[i], MOVE_DEST[i] = MOVE_DRAW, STOCK, WASTE
+            MOVE_COUNT[i] = int(code[2:])
+            continue
+        src = pile_lookup(code[0])
+        dest = pile_lookup(code[1])
+        n = int(code[3:]) if "-" in code else 1
+        if src == WASTE:
+            kind = MOVE_WASTE_TABLEAU if dest <= TABLEAU7 else MOVE_WASTE_FOUNDATION
+        elif src >= FOUNDATION_C:
+            kind = MOVE_FOUNDATION_TABLEAU
+        else:
+            kind = MOVE_TABLEAU if dest <= TABLEAU7 else MOVE_TO_FOUNDATION
+            if kind == MOVE_TABLEAU:
+                assert t2t_id(src, dest, n) == i
+        MOVE_KIND[i], MOVE_SRC[i], MOVE_DEST[i], MOVE_COUNT[i] = kind, src, dest, n
+    for i, code in enumerate(sorted(MOVE_CODES)):
+        MOVE_CODE_RANK[MOVE_IDS[code]] = i
+
+
+init_moves()
+
+
+def move_code(int move_id):
+    """ the ShootMe move code of a move id """
+    return MOVE_CODES[move_id]
+
+
+def move_id(code):
+    """ the move id of a ShootMe move code """
+    try:
+        return MOVE_IDS[code]
+    except KeyError:
+        raise ValueError(f"no move id for move code {code!r}")
+
+
+def move_info(int move_id):
+    """ (kind, source pile, destination pile, number of cards or draws) """
+    if move_id < 0 or move_id >= NUM_MOVES:
+        raise ValueError(f"invalid move id {move_id}")
+    return (
+        MOVE_KIND[move_id], MOVE_SRC[move_id], MOVE_DEST[move_id], MOVE_COUNT[move_id]
+    )
+
+
+cdef int packed_legal_move_ids(Klon* k, int* out):
+    """ writes the ids of all legal moves into out, returns how many """
+    cdef int src, dest, fnd, fu, n, num_to_move, s, draw_count
+    cdef int count = 0
+    cdef int talon_len = k.start[1]
+    cdef unsigned char card
+
+    # tableau to tableau
+    for src in range(TABLEAU1, TABLEAU7 + 1):
+        n = seg_len(k, src)
+        fu = packed_count_face_up(k, src)
+        for dest in range(TABLEAU1, TABLEAU7 + 1):
+            if src == dest:
+                continue
+            for num_to_move in range(1, fu + 1):
+                card = k.cards[k.start[src + 1] - num_to_move]
+                if seg_len(k, dest) == 0:
+                    # only a king, and not the entire pile (that would be useless)
+                    if packed_rank(card) != 12 or n <= num_to_move:
+                        continue
+                elif not packed_can_stack(card, k.cards[k.start[dest + 1] - 1]):
+                    continue
+                out[count] = t2t_id(src, dest, num_to_move)
+                count += 1
+
+    # tableau to foundation
+    for src in range(TABLEAU1, TABLEAU7 + 1):
+        if seg_len(k, src) == 0:
+            continue
+        card = k.cards[k.start[src + 1] - 1]
+        fnd = 8 + packed_suit(card)
+        if seg_len(k, fnd) == packed_rank(card):
+            out[count] = T2F_BASE + (src - 1) * 4 + fnd - 8
+            count += 1
+
+    if k.split < talon_len:
+        card = k.cards[k.split] & CARD_MASK
+        # waste to tableau
+        for dest in range(TABLEAU1, TABLEAU7 + 1):
+            if seg_len(k, dest) == 0:
+                if packed_rank(card) != 12:
+                    continue
+            elif not packed_can_stack(card, k.cards[k.start[dest + 1] - 1]):
+                continue
+            out[count] = W2T_BASE + dest - 1
+            count += 1
+        # waste to foundation
+        fnd = 8 + packed_suit(card)
+        if seg_len(k, fnd) == packed_rank(card):
+            out[count] = W2F_BASE + fnd - 8
+            count += 1
+
+    # foundation to tableau
+    for fnd in range(8, NUM_SEGMENTS):
+        if seg_len(k, fnd) == 0:
+            continue
+        card = k.cards[k.start[fnd + 1] - 1]
+        for dest in range(TABLEAU1, TABLEAU7 + 1):
+            if seg_len(k, dest) == 0:
+                continue
+            if packed_can_stack(card, k.cards[k.start[dest + 1] - 1]):
+                out[count] = F2T_BASE + (fnd - 8) * 7 + dest - 1
+                count += 1
+
+    # draw moves
+    for draw_count in range(DRAW_MOVES[talon_len][k.split]):
+        out[count] = DRAW_BASE + draw_count
+        count += 1
+
+    # ascending ids (insertion sort: only the tableau moves are out of order)
+    for s in range(1, count):
+        n = out[s]
+        fu = s - 1
+        while fu >= 0 and out[fu] > n:
+            out[fu + 1] = out[fu]
+            fu -= 1
+        out[fu + 1] = n
+    return count
+
+
+cdef int klon_apply(Klon* k, int move_id) except -1:
+    if move_id < 0 or move_id >= NUM_MOVES:
+        raise ValueError(f"invalid move id {move_id}")
+    if collect_stats:
+        counters.states += 1
+    if MOVE_KIND[move_id] == MOVE_DRAW:
+        return klon_draw_n(k, MOVE_COUNT[move_id])
+    return klon_move(k, MOVE_SRC[move_id], MOVE_DEST[move_id], MOVE_COUNT[move_id])
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+cdef class LRUCache:
+    """
+    Mapping holding at most `maxsize` entries, evicting the least
+    recently used one, and counting lookup hits and misses.
+    """
+    cdef object entries
+    cdef readonly Py_ssize_t maxsize
+    cdef readonly long hits
+    cdef readonly long misses
+
+    def __init__(self, maxsize=100_000):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.entries = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    cpdef get(self, key, default=None):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    cpdef put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# A card that can never move again makes the deal unsolvable. The
+# face-down cards below a card in its tableau stay put until it has moved
+# (face-up cards do not: they can be carried off in a sequence with it). A
+# non-king card goes to its foundation only after every lower card of its
+# suit, and onto a tableau only onto one of its two build cards (the next
+# rank up in the other colour), so it is stuck for good if, face-down below
+# it, there are
+#  - a lower card of its suit and both of its build cards, or
+#  - a lower card of its suit, one build card and a lower card of the suit
+#    of its twin (the other card of its colour and rank), while the twin
+#    lies on the other build card, or is above it in the same tableau and
+#    can only move there: the twin then waits for the card to move, which
+#    waits for the build card under the twin.
+# More generally, a set of cards may wait for each other (packed_deadlock).
+# These are proofs, never flagging a state that a solution passes through.
+
+
+cdef inline unsigned long long lower_of_suit(int card):
+    """ bit mask of the cards of card's suit lower than card """
+    return ((1ULL << packed_rank(card)) - 1) << (packed_suit(card) * 13)
+
+
+cdef extern from *:
+    int __builtin_ctzll(unsigned long long)
+
+
+cdef inline unsigned long long build_cards(int card):
+    """ bit mask of the two cards card can be built on in a tableau """
+    cdef int suit = packed_suit(card), rank = packed_rank(card)
+    return (1ULL << ((suit ^ 1) * 13 + rank + 1)) | (1ULL << ((suit ^ 3) * 13 + rank + 1))
+
+
+cdef inline int find_card(Klon* k, int card):
+    cdef int i
+    for i in range(k.start[NUM_SEGMENTS]):
+        if k.cards[i] & CARD_MASK == card:
+            return i
+    return -1
+
+
+cdef inline int tableau_of(Klon* k, int pos):
+    """ the tableau holding position pos, -1 if it is not in a tableau """
+    cdef int tab
+    for tab in range(TABLEAU1, TABLEAU7 + 1):
+        if k.start[tab] <= pos < k.start[tab + 1]:
+            return tab
+    return -1
+
+
+cdef int packed_dead_end(Klon* k):
+    cdef int tab, i, card, suit, build, other, twin, pos
+    cdef unsigned long long below  # bit mask of the face-down cards below i
+    for tab in range(TABLEAU1, TABLEAU7 + 1):
+        below = 0
+        for i in range(k.start[tab], k.start[tab + 1]):
+            card = k.cards[i] & CARD_MASK
+            if packed_rank(card) != 12 and below & lower_of_suit(card):
+                suit = packed_suit(card)
+                build = (suit ^ 1) * 13 + packed_rank(card) + 1
+                other = (suit ^ 3) * 13 + packed_rank(card) + 1
+                if not below & (1ULL << build):
+                    build, other = other, build
+                if below & (1ULL << build):
+                    if below & (1ULL << other):
+                        return 1
+                    twin = card + 26 if suit < 2 else card - 26
+                    if below & lower_of_suit(twin):
+                        pos = find_card(k, twin)
+                        if i < pos < k.start[tab + 1]:
+                            return 1
+                        if tableau_of(k, pos) > 0 and pos == find_card(k, other) + 1:
+                            if tableau_of(k, pos) == tableau_of(k, pos - 1):
+                                return 1
+            if k.cards[i] & FACE_DOWN:
+                below |= 1ULL << card
+    return packed_deadlock(k)
+
+
+cdef int packed_deadlock(Klon* k):
+    """
+    Is there a set of tableau cards none of which can move before another
+    of them has? Every card below one of them waits for it, so a card of
+    the set can move first only onto a build card no card of the set
+    covers, to its foundation once no lower card of its suit is in or
+    under the set, or carried off by the face-up card under it, which must
+    be outside the set. Starting from the non-king tableau cards with both
+    build cards and a lower card of their suit in the tableaux (any other
+    card could always move first), cards that could move first are
+    dropped until none can: anything left is stuck for good.
+    """
+    cdef unsigned long long in_tableau = 0, stuck = 0, covered, rest
+    cdef unsigned long long under[NUM_CARDS]  # cards below each one in its tableau
+    cdef signed char carrier[NUM_CARDS]  # the face-up card under each one, or -1
+    cdef int tab, i, card
+    cdef bint changed = True
+    for tab in range(TABLEAU1, TABLEAU7 + 1):
+        covered = 0
+        for i in range(k.start[tab], k.start[tab + 1]):
+            card = k.cards[i] & CARD_MASK
+            under[card] = covered
+            covered |= 1ULL << card
+            carrier[card] = -1
+            if i > k.start[tab] and not k.cards[i - 1] & FACE_DOWN:
+                carrier[card] = k.cards[i - 1] & CARD_MASK
+        in_tableau |= covered
+    rest = in_tableau
+    while rest:
+        card = __builtin_ctzll(rest)
+        rest &= rest - 1
+        if packed_rank(card) == 12 or not in_tableau & lower_of_suit(card):
+            continue
+        if in_tableau & build_cards(card) == build_cards(card):
+            stuck |= 1ULL << card
+    while stuck and changed:
+        changed = False
+        covered = 0
+        rest = stuck
+        while rest:
+            covered |= under[__builtin_ctzll(rest)]
+            rest &= rest - 1
+        rest = stuck
+        while rest:
+            card = __builtin_ctzll(rest)
+            rest &= rest - 1
+            if (
+                not lower_of_suit(card) & (stuck | covered)
+                or covered & build_cards(card) != build_cards(card)
+                or (carrier[card] >= 0 and not stuck & (1ULL << carrier[card]))
+            ):
+                stuck &= ~(1ULL << card)
+                changed = True
+    return stuck != 0
+
+
+def state_is_dead_end(state):
+    """ is some card provably unable to ever move again (see above)? """
+    cdef PackedState packed
+    if isinstance(state, PackedState):
+        packed = state
+    else:
+        packed = pack_state(state)
+    return packed_dead_end(&packed.k) == 1
+
+
+# With pruning on, no moves are generated from dead-end states (by
+# get_legal_moves_ids and what builds on it, the greedy playout and
+# solve_dfs), so searches give them up at once; with the legal move cache
+# on, the verdict is cached along with the moves. Legal move masks are
+# unaffected.
+cdef bint prune_dead_ends = False
+cdef long long dead_end_checks = 0
+cdef long long dead_ends_found = 0
+cdef long long dead_end_moves_pruned = 0
+
+DeadEndInfo = namedtuple("DeadEndInfo", ["checks", "dead_ends", "moves_pruned"])
+
+
+def enable_dead_end_pruning():
+    """ turns pruning on and resets its counters """
+    global prune_dead_ends, dead_end_checks, dead_ends_found, dead_end_moves_pruned
+    prune_dead_ends = True
+    dead_end_checks = dead_ends_found = dead_end_moves_pruned = 0
+    if legal_moves_cache is not None:
+        legal_moves_cache.clear()
+
+
+def disable_dead_end_pruning():
+    global prune_dead_ends
+    prune_dead_ends = False
+    if legal_moves_cache is not None:
+        legal_moves_cache.clear()
+
+
+def dead_end_info():
+    """
+    DeadEndInfo of the states checked since pruning was enabled, those
+    found to be dead ends and the legal moves not generated from them
+    """
+    return DeadEndInfo(dead_end_checks, dead_ends_found, dead_end_moves_pruned)
+
+
+# With auto foundation moves on, a state with a safe foundation move offers
+# that move alone to the searches (through the same functions as pruning),
+# so it is played right away and recorded like any other move. A card is
+# safe to put up if it is an ace or a two, or if the cards that could want
+# it in a tableau, the two lower cards of the other colour, are already up,
+# as are the cards that could want those, the cards of its colour two ranks
+# lower. Any solution can then be kept, so searches stay complete.
+cdef bint auto_foundation = False
+
+
+def enable_auto_foundation():
+    global auto_foundation
+    auto_foundation = True
+    if legal_moves_cache is not None:
+        legal_moves_cache.clear()
+
+
+def disable_auto_foundation():
+    global auto_foundation
+    auto_foundation = False
+    if legal_moves_cache is not None:
+        legal_moves_cache.clear()
+
+
+cdef bint safe_foundation_move(Klon* k, int move_id):
+    cdef int suit, rank
+    if MOVE_KIND[move_id] == MOVE_TO_FOUNDATION:
+        suit = (move_id - T2F_BASE) % 4
+    elif MOVE_KIND[move_id] == MOVE_WASTE_FOUNDATION:
+        suit = move_id - W2F_BASE
+    else:
+        return False
+    rank = seg_len(k, 8 + suit)  # of the card going up
+    return rank <= 1 or (
+        seg_len(k, 8 + (suit ^ 1)) >= rank
+        and seg_len(k, 8 + (suit ^ 3)) >= rank
+        and seg_len(k, 8 + (suit ^ 2)) >= rank - 1
+    )
+
+
+cdef int search_move_ids(Klon* k, int* out):
+    """
+    packed_legal_move_ids as the searches see them: none from a dead end
+    when pruning is on, only the first safe foundation move when auto
+    foundation moves are on
+    """
+    global dead_end_checks, dead_ends_found, dead_end_moves_pruned
+    cdef double t = clock() if collect_stats else 0
+    cdef int i, count = packed_legal_move_ids(k, out)
+    if prune_dead_ends and count > 0:
+        dead_end_checks += 1
+        if packed_dead_end(k):
+            dead_ends_found += 1
+            dead_end_moves_pruned += count
+            count = 0
+    if auto_foundation:
+        for i in range(count):
+            if safe_foundation_move(k, out[i]):
+                out[0] = out[i]
+                count = 1
+                break
+    if collect_stats:
+        counters.legal_move_calls += 1
+        counters.movegen_seconds += clock() - t
+    return count
+
+
+# legal move ids by state hash; off unless enable_legal_move_cache is called
+cdef LRUCache legal_moves_cache = None
+
+
+def enable_legal_move_cache(maxsize=100_000):
+    """
+    Remember the legal moves of the last `maxsize` states seen (by their
+    Zobrist hash) in get_legal_moves_ids / get_legal_moves.
+    """
+    global legal_moves_cache
+    legal_moves_cache = LRUCache(maxsize)
+    return legal_moves_cache
+
+
+def disable_legal_move_cache():
+    global legal_moves_cache
+    legal_moves_cache = None
+
+
+def legal_move_cache_info():
+    """ CacheInfo of the legal move cache, None if it is disabled """
+    if legal_moves_cache is None:
+        return None
+    return legal_moves_cache.info()
+
+
+cpdef tuple get_legal_moves_ids(state):
+    """ ids of the legal moves given the state, in ascending order """
+    cdef int ids[NUM_MOVES]
+    cdef int i, count
+    cdef PackedState packed
+    cdef tuple moves
+    if isinstance(state, PackedState):
+        packed = state
+    else:
+        packed = pack_state(state)
+    if legal_moves_cache is not None:
+        moves = legal_moves_cache.get(packed.k.hash)
+        if moves is not None:
+            return moves
+    count = search_move_ids(&packed.k, ids)
+    moves = tuple([ids[i] for i in range(count)])
+    if legal_moves_cache is not None:
+        legal_moves_cache.put(packed.k.hash, moves)
+    return moves
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fill_legal_move_masks(states, unsigned char[:, ::1] out):
+    """
+    For each states[i], sets row out[i] to 1 at the ids of its legal moves
+    and 0 elsewhere. Moves with ids past the row width are left out.
+    """
+    cdef int ids[NUM_MOVES]
+    cdef int i, j, count
+    cdef Py_ssize_t row = 0, width = out.shape[1]
+    cdef PackedState packed
+    if len(states) > out.shape[0]:
+        raise ValueError(f"{len(states)} states but {out.shape[0]} mask rows")
+    for state in states:
+        if isinstance(state, PackedState):
+            packed = state
+        else:
+            packed = pack_state(state)
+        count = packed_legal_move_ids(&packed.k, ids)
+        memset(&out[row, 0], 0, width)
+        for j in range(count):
+            if ids[j] < width:
+                out[row, ids[j]] = 1
+        row += 1
+
+
+DEF VEC_ROWS = 233
+# first row of each pile in a state vector (see vectorize.PAD), by pile index
+cdef int[14] VEC_OFFSET = [
+    0, 24, 43, 62, 81, 100, 119, 138, 157, 181, 194, 207, 220, VEC_ROWS
+]
+
+
+cdef inline short card_index(unsigned char card):
+    """ index of a packed card in vectorize.all_cards """
+    return (card & CARD_MASK) + (NUM_CARDS if card & FACE_DOWN else 0)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fill_card_indices(states, short[:, ::1] out, short pad):
+    """
+    Sets row out[i] to the card indices (into vectorize.all_cards) of
+    states[i]: the piles in KlonState order, each padded with `pad` up to
+    its size in a state vector.
+    """
+    cdef int i, j, pile, seg
+    cdef Py_ssize_t row = 0
+    cdef PackedState packed
+    cdef Klon* k
+    if len(states) > out.shape[0]:
+        raise ValueError(f"{len(states)} states but {out.shape[0]} rows")
+    if out.shape[1] != VEC_ROWS:
+        raise ValueError(f"rows must have {VEC_ROWS} entries")
+    for state in states:
+        if isinstance(state, PackedState):
+            packed = state
+        else:
+            packed = pack_state(state)
+        k = &packed.k
+        for j in range(VEC_ROWS):
+            out[row, j] = pad
+        for i in range(k.split):
+            out[row, i] = card_index(k.cards[i])
+        for j, i in enumerate(range(k.start[1] - 1, k.split - 1, -1)):
+            out[row, VEC_OFFSET[WASTE] + j] = card_index(k.cards[i])
+        for pile in range(TABLEAU1, FOUNDATION_H + 1):
+            if pile == WASTE:
+                continue
+            seg = pile_segment(pile)
+            for j in range(seg_len(k, seg)):
+                out[row, VEC_OFFSET[pile] + j] = card_index(k.cards[k.start[seg] + j])
+        row += 1
+
+
+cdef inline int put_card_index(Klon* k, int pos, short idx) except -1:
+    if pos >= NUM_CARDS:
+        raise ValueError("more than 52 cards")
+    if idx < 0 or idx >= 2 * NUM_CARDS:
+        raise ValueError(f"invalid card index {idx}")
+    k.cards[pos] = idx if idx < NUM_CARDS else (idx - NUM_CARDS) | FACE_DOWN
+    return 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def unpack_card_indices(short[:, ::1] indices, short pad):
+    """
+    Inverse of fill_card_indices: a PackedState for each row of indices.
+    Entries equal to `pad` are skipped.
+    """
+    cdef int i, j, pile, pos
+    cdef PackedState packed
+    cdef Klon* k
+    if indices.shape[1] != VEC_ROWS:
+        raise ValueError(f"rows must have {VEC_ROWS} entries")
+    states = []
+    for i in range(indices.shape[0]):
+        packed = PackedState.__new__(PackedState)
+        k = &packed.k
+        pos = 0
+        k.start[TALON] = 0
+        for j in range(VEC_OFFSET[STOCK], VEC_OFFSET[TABLEAU1]):
+            if indices[i, j] != pad:
+                put_card_index(k, pos, indices[i, j])
+                pos += 1
+        k.split = pos
+        for j in range(VEC_OFFSET[FOUNDATION_C] - 1, VEC_OFFSET[WASTE] - 1, -1):
+            if indices[i, j] != pad:
+                put_card_index(k, pos, indices[i, j])
+                pos += 1
+        if pos > SEG_CAPACITY[TALON]:
+            raise ValueError("too many cards in the talon")
+        for pile in range(TABLEAU1, FOUNDATION_H + 1):
+            if pile == WASTE:
+                continue
+            k.start[pile_segment(pile)] = pos
+            for j in range(VEC_OFFSET[pile], VEC_OFFSET[pile + 1]):
+                if indices[i, j] != pad:
+                    put_card_index(k, pos, indices[i, j])
+                    pos += 1
+        k.start[NUM_SEGMENTS] = pos
+        k.hash = klon_full_hash(k)
+        states.append(packed)
+    return states
+
+
+cpdef play_move_id(state, int move_id):
+    """ play_move, taking a move id """
+    cdef Klon k
+    if not isinstance(state, PackedState):
+        return play_move(state, move_code(move_id))
+    k = (<PackedState>state).k
+    klon_apply(&k, move_id)
+    return new_packed(&k)
+
+
+cdef class SearchState(PackedState):
+    """
+    Mutable PackedState for search loops that backtrack.
+
+    do_move() changes the piles in place and undo_move() takes the last
+    move back, so walking a search tree allocates nothing per node.
+    Functions taking a state accept it like any PackedState; those that
+    return a state (play_move, draw, ...) return an immutable snapshot.
+    """
+    cdef Klon* undo_stack    # state before each move made so far
+    cdef int* move_stack     # ids of the moves made so far
+    cdef int depth
+    cdef int capacity
+
+    def __cinit__(self, *args, **kwargs):
+        self.undo_stack = NULL
+        self.move_stack = NULL
+        self.depth = 0
+        self.capacity = 0
+
+    def __init__(self, state):
+        if isinstance(state, PackedState):
+            self.k = (<PackedState>state).k
+        else:
+            self.k = pack_state(state).k
+
+    def __dealloc__(self):
+        PyMem_Free(self.undo_stack)
+        PyMem_Free(self.move_stack)
+
+    cdef int grow(self) except -1:
+        cdef int capacity = max(64, 2 * self.capacity)
+        cdef Klon* undo_stack = <Klon*>PyMem_Realloc(
+            self.undo_stack, capacity * sizeof(Klon)
+        )
+        if undo_stack == NULL:
+            raise MemoryError()
+        self.undo_stack = undo_stack
+        cdef int* move_stack = <int*>PyMem_Realloc(
+            self.move_stack, capacity * sizeof(int)
+        )
+        if move_stack == NULL:
+            raise MemoryError()
+        self.move_stack = move_stack
+        self.capacity = capacity
+        return 0
+
+    cpdef do_move(self, int move_id):
+        """ play a move (by id) in place """
+        if self.depth == self.capacity:
+            self.grow()
+        self.undo_stack[self.depth] = self.k
+        try:
+            klon_apply(&self.k, move_id)
+        except:
+            self.k = self.undo_stack[self.depth]
+            raise
+        self.move_stack[self.depth] = move_id
+        self.depth += 1
+
+    cpdef int undo_move(self) except -1:
+        """ take back the last move, returns its id """
+        if self.depth == 0:
+            raise IndexError("no move to undo")
+        self.depth -= 1
+        self.k = self.undo_stack[self.depth]
+        return self.move_stack[self.depth]
+
+    def legal_moves(self):
+        """ ids of the legal moves, in ascending order """
+        return get_legal_moves_ids(self)
+
+    @property
+    def num_moves(self):
+        """ number of moves that can be undone """
+        return self.depth
+
+    @property
+    def moves(self):
+        """ ids of the moves made so far, first move first """
+        return tuple([self.move_stack[i] for i in range(self.depth)])
+
+    def snapshot(self):
+        """ the current position as a KlonState """
+        return self.to_klonstate()
+
+    def packed(self):
+        """ the current position as an (immutable) PackedState """
+        return new_packed(&self.k)
+
+    def __hash__(self):
+        raise TypeError("unhashable type: 'SearchState' (use state_hash)")
+
+    def __reduce__(self):
+        return (SearchState, (self.packed(),))
+
+    def __repr__(self):
+        piles = ", ".join(f"{f}={p!r}" for f, p in zip(KlonState._fields, self))
+        return f"SearchState({piles})"
+
+
+### YAN ET AL (2005) MOVE SCORES
+# see policies.yan_et_al for the rules
+
+cdef void yan_et_al_score(
+    Klon* k, int move_id, short* location, bint* located, int* reward, int* pri
+):
+    """
+    location[card]: position of each card in k.cards (-1 if it is not in
+    the state), for king moves; filled in on first use, setting located
+    """
+    cdef int kind = MOVE_KIND[move_id]
+    cdef int i, card, queen, n, fu
+    reward[0] = pri[0] = 0
+    if kind == MOVE_TO_FOUNDATION:
+        reward[0] = 5
+    elif kind == MOVE_FOUNDATION_TABLEAU:
+        reward[0] = -10
+    elif kind == MOVE_WASTE_TABLEAU:
+        reward[0] = 5
+        card = k.cards[k.split] & CARD_MASK
+        if packed_rank(card) != 12:
+            pri[0] = 1
+            return
+        # a king: where is its queen?
+        if not located[0]:
+            for i in range(NUM_CARDS):
+                location[i] = -1
+            for i in range(k.start[NUM_SEGMENTS]):
+                location[k.cards[i] & CARD_MASK] = i
+            located[0] = True
+        queen = location[card - 1]
+        if queen < 0:  # not in the state
+            pass
+        elif queen < k.start[TABLEAU1]:  # in the stock or waste
+            pri[0] = 1
+        elif queen < k.start[8]:  # in a tableau
+            pri[0] = -1 if k.cards[queen] & FACE_DOWN else 1
+    elif kind == MOVE_TABLEAU:
+        n = seg_len(k, MOVE_SRC[move_id])
+        fu = packed_count_face_up(k, MOVE_SRC[move_id])
+        if MOVE_COUNT[move_id] == fu and n > fu:  # turns up a card
+            pri[0] = n - fu + 1
+        elif MOVE_COUNT[move_id] == n:  # empties the tableau
+            pri[0] = 1
+    elif kind == MOVE_DRAW and MOVE_COUNT[move_id] != 1:
+        pri[0] = -1
+
+
+cdef int yan_et_al_move_ids(state, moves, Klon** k, int* ids) except -1:
+    cdef PackedState packed
+    if isinstance(state, PackedState):
+        packed = state
+    else:
+        packed = pack_state(state)
+    k[0] = &packed.k
+    if moves is None:
+        moves = get_legal_moves_ids(packed)
+    if len(moves) > NUM_MOVES:
+        raise ValueError("too many moves")
+    for i, move_id in enumerate(moves):
+        if move_id < 0 or move_id >= NUM_MOVES:
+            raise ValueError(f"invalid move id {move_id}")
+        ids[i] = move_id
+    return len(moves)
+
+
+cpdef list yan_et_al_scores(state, moves=None):
+    """
+    (reward, priority) of each move id in moves (default: the legal moves)
+    """
+    cdef int ids[NUM_MOVES]
+    cdef short location[NUM_CARDS]
+    cdef bint located = False
+    cdef int i, count, reward, pri
+    cdef Klon* k
+    count = yan_et_al_move_ids(state, moves, &k, ids)
+    cdef double t = clock() if collect_stats else 0
+    scores = []
+    for i in range(count):
+        yan_et_al_score(k, ids[i], location, &located, &reward, &pri)
+        scores.append((reward, pri))
+    if collect_stats:
+        counters.scored_moves += count
+        counters.scoring_seconds += clock() - t
+    return scores
+
+
+cpdef tuple yan_et_al_ranking(state, moves=None):
+    """
+    moves (default: the legal moves) ordered by (reward, priority),
+    best first, ties going to the greater move code
+    """
+    cdef int ids[NUM_MOVES]
+    cdef long keys[NUM_MOVES]
+    cdef short location[NUM_CARDS]
+    cdef bint located = False
+    cdef int i, j, m, count, reward, pri
+    cdef long key
+    cdef Klon* k
+    count = yan_et_al_move_ids(state, moves, &k, ids)
+    cdef double t = clock() if collect_stats else 0
+    for i in range(count):
+        yan_et_al_score(k, ids[i], location, &located, &reward, &pri)
+        keys[i] = ((reward + 16) * 64 + pri + 32) * NUM_MOVES + MOVE_CODE_RANK[ids[i]]
+    # insertion sort, greatest key first
+    for i in range(1, count):
+        m, key = ids[i], keys[i]
+        j = i - 1
+        while j >= 0 and keys[j] < key:
+            ids[j + 1], keys[j + 1] = ids[j], keys[j]
+            j -= 1
+        ids[j + 1], keys[j + 1] = m, key
+    if collect_stats:
+        counters.scored_moves += count
+        counters.scoring_seconds += clock() - t
+    return tuple([ids[i] for i in range(count)])
+
+
+cdef int yan_et_al_best(Klon* k, int* ids, int count):
+    """ the first move of yan_et_al_ranking, -1 if there are no moves """
+    cdef short location[NUM_CARDS]
+    cdef bint located = False
+    cdef int i, reward, pri, best = -1
+    cdef long key, best_key = -1
+    cdef double t = clock() if collect_stats else 0
+    for i in range(count):
+        yan_et_al_score(k, ids[i], location, &located, &reward, &pri)
+        key = ((reward + 16) * 64 + pri + 32) * NUM_MOVES + MOVE_CODE_RANK[ids[i]]
+        if key > best_key:
+            best, best_key = ids[i], key
+    if collect_stats:
+        counters.scored_moves += count
+        counters.scoring_seconds += clock() - t
+    return best
+
+
 @cython.boundscheck(False)
 cpdef get_legal_moves(state):
     """ returns a set of legal moves given the state """
+    if (
+        isinstance(state, PackedState)
+        or legal_moves_cache is not None
+        or prune_dead_ends
+        or auto_foundation
+    ):
+        return {MOVE_CODES[i] for i in get_legal_moves_ids(state)}
     moves = set()
     # tab to tab
     moves = moves.union(tableau_to_tableau(state))
@@ -280,10 +1764,19 @@ cpdef get_legal_moves(state):
 
 
 def copy(state):
+    if isinstance(state, SearchState):
+        return SearchState(state)
+    if isinstance(state, PackedState):
+        return state  # immutable
     return KlonState(*state)
 
 
 def replace_stock(state):
+    cdef Klon k
+    if isinstance(state, PackedState):
+        k = (<PackedState>state).k
+        klon_replace_stock(&k)
+        return new_packed(&k)
     new_waste = ()
     new_stock = tuple(reversed(state[WASTE]))  # reverse the waste pile
     new_state = list(state)
@@ -325,6 +1818,11 @@ cpdef last_face_up(pile):
 
 @cython.boundscheck(False)
 cpdef move(state, src_pile, dest_pile, cards=1):
+    cdef Klon k
+    if isinstance(state, PackedState):
+        k = (<PackedState>state).k
+        klon_move(&k, src_pile, dest_pile, cards)
+        return new_packed(&k)
     new_src = last_face_up(state[src_pile][:-cards])
     new_dest = state[dest_pile] + state[src_pile][-cards:]
     new_state = list(state)
@@ -335,6 +1833,11 @@ cpdef move(state, src_pile, dest_pile, cards=1):
 
 @cython.boundscheck(False)
 cpdef draw(state):
+    cdef Klon k
+    if isinstance(state, PackedState):
+        k = (<PackedState>state).k
+        klon_draw(&k)
+        return new_packed(&k)
     new_waste = state[WASTE]
     new_stock = state[STOCK]
     draw_count = min(3, len(state[STOCK]))
@@ -357,16 +1860,18 @@ cpdef play_move(state, move_code):
     DR# is a draw move that is done # number of times.
     ie) DR2 means draw twice, if draw count > 1 it is still DR2.
     """
-    cdef int draws_remaining
+    cdef int split, talon_len
+    if isinstance(state, PackedState):
+        return packed_play_move(<PackedState>state, move_code)
     if move_code.startswith("DR"):
-        st = state
-        draws_remaining = int(move_code[2:])
-        while draws_remaining >= 1:
-            if len(st.stock) == 0:
-                st = replace_stock(st)
-            st = draw(st)
-            draws_remaining -= 1
-        return st
+        # the talon is the stock followed by the waste turned over;
+        # drawing only moves the split between the two
+        talon = state[STOCK] + state[WASTE][::-1]
+        split = draw_split(len(talon), len(state[STOCK]), int(move_code[2:]))
+        new_state = list(state)
+        new_state[STOCK] = talon[:split]
+        new_state[WASTE] = talon[split:][::-1]
+        return KlonState(*new_state)
 
     """
     NEW is to represent the moving of cards from the
@@ -401,6 +1906,24 @@ cpdef play_move(state, move_code):
     return move(state, src, dest, cards=cards)
 
 
+cdef PackedState packed_play_move(PackedState state, move_code):
+    cdef Klon k = state.k
+    if move_code.startswith("DR"):
+        klon_draw_n(&k, int(move_code[2:]))
+    elif move_code == "NEW":
+        klon_replace_stock(&k)
+    elif move_code.startswith("F"):
+        return state
+    elif "-" in move_code:
+        xy, num = move_code.split("-")
+        x, y = xy
+        klon_move(&k, pile_lookup(x), pile_lookup(y), int(num))
+    else:
+        x, y = move_code
+        klon_move(&k, pile_lookup(x), pile_lookup(y), 1)
+    return new_packed(&k)
+
+
 cdef int pile_lookup(char* pilestr):
     cdef char p = pilestr[0]
     if p == 49: return TABLEAU1      # 1
@@ -417,7 +1940,20 @@ cdef int pile_lookup(char* pilestr):
     if p == 87: return WASTE         # W
 
 
+cdef int packed_is_win(Klon* k):
+    cdef int fnd, i
+    for fnd in range(8, NUM_SEGMENTS):
+        if seg_len(k, fnd) != 13:
+            return 0  # also covers cards left in the talon or tableaus
+        for i in range(13):
+            if k.cards[k.start[fnd] + i] != (fnd - 8) * 13 + i:
+                return 0
+    return 1
+
+
 cpdef state_is_win(state):
+    if isinstance(state, PackedState):
+        return packed_is_win(&(<PackedState>state).k) == 1
     cards = "A23456789TJQK"
     if len(state.stock) != 0:
         return False
@@ -445,93 +1981,6 @@ cpdef state_is_win(state):
     return True
 
 
-cdef int same_rank_upordown(char* card, char* onto):
-    cdef int cs = card[SUIT]
-    cdef int os = onto[SUIT]
-    cdef int C = 67
-    cdef int D = 68
-    cdef int S = 83
-    cdef int H = 72
-    # if these are facedown suits, convert ords to upper case
-    if cs >= 97:
-        cs -= 32
-    if os >= 97:
-        os -= 32
-    if (cs == D or cs == H) and (os == D or os == H):
-        return 1
-    if (cs == C or cs == S) and (os == C or os == S):
-        return 1
-    return 0
-
-
-cdef int value_is_lower(char* a, char* b):
-    # is A lower than B?
-    cdef int av = a[0]
-    cdef int bv = b[0]
-
-    # convert facedown values to faceup
-    if av >= 97: # a=97 A=65; t=116 T=84; j=113 J=81; q=113 Q=81; k=107 K=75
-        av -= 32
-    if bv >= 97:
-        bv -= 32
-
-    # ace is lower than everything except ace
-    if av == 65:
-        return bv != 65
-    # king is lower than nothing
-    if bv == 75:
-        return 0 # false
-    if av <= 57: # if a is a number card... (2=50, 9=57)
-        return av < bv # this works for number cards, TQJK are also higher than 57
-    if av == 84: # T=84 lower than J, Q, K
-        return bv == 74 or bv == 81 or bv == 75
-    if av == 74: # J=74 lower than Q, K
-        return bv == 81 or bv == 75
-    if av == 81: # Q=81 lower than K=75
-        return bv == 75
-
-
-cdef lower_card_same_rank_in_pile(card, pile):
-    cdef int count = 0
-    cdef char* other
-    for other in pile:
-        if same_rank_upordown(card, other) and value_is_lower(other, card):
-            # print(f'same rank {card} {other}')
-            # print(f'value is lower {other} {card}')
-            count += 1
-        if count == 2:
-            return True
-    return False
-
-
-cdef tableau_to_foundation_dead_end(pile):
-    faceup = []
-    facedown = []
-    cdef char* card
-    for card in pile:
-        if card_is_face_down(card):
-            facedown.append(card)
-        else:
-            faceup.append(card)
-    if len(facedown) == 0:
-        return False
-    for card in faceup:
-        if lower_card_same_rank_in_pile(card, facedown):
-            return True
-    return False
-
-
-def state_is_dead_end(state):
-    # states in which two cards of same colour and rank are in the same
-    # Tableau stack blocking both of their paths to the Foundation
-    # and one of their Tableau build cards.
-    for tab in range(TABLEAU1, TABLEAU7+1):
-        pile = state[tab]
-        if tableau_to_foundation_dead_end(pile):
-            return True
-    return False
-
-
 cpdef all_cards_faceup(state):
     cdef int tab
     cdef char* card
@@ -601,3 +2050,348 @@ def to_pretty_string(state):
     for tab in range(TABLEAU1, TABLEAU7+1):
         s += f"\nTab {tab}: " + " ".join(state[tab])
     return s
+
+
+### SHOOTME DEALS
+# ShootMe/Klondike-Solver's seeded shuffle (`KlondikeSolver /G seed`), so a
+# deal needs neither the solver binary nor a harvested result. Its generator
+# keeps its state in 32-bit signed ints: the shift of `mix` is arithmetic.
+
+cdef struct ShootMeRandom:
+    unsigned int value, mix, twist
+
+
+cdef inline void shootme_next(ShootMeRandom* r):
+    # y = value ^ twist - mix ^ value, which C parses as twist - mix
+    cdef unsigned int y = r.twist - r.mix
+    y ^= r.twist ^ r.value ^ r.mix
+    r.mix ^= r.twist ^ r.value
+    r.value ^= r.twist - r.mix
+    r.twist ^= r.value ^ y
+    r.value ^= (r.twist << 7) ^ <unsigned int>((<int>r.mix) >> 16) ^ (y << 8)
+
+
+cdef void shootme_seed(ShootMeRandom* r, int seed):
+    cdef int i
+    r.mix = 51651237
+    r.twist = 895213268
+    r.value = seed
+    for i in range(50):
+        shootme_next(r)
+    seed ^= seed >> 15
+    r.value = 0x9417B3AF ^ <unsigned int>seed
+    for i in range(950):
+        shootme_next(r)
+
+
+cdef inline int shootme_next1(ShootMeRandom* r):
+    shootme_next(r)
+    return r.value & 0x7fffffff
+
+
+cdef void shootme_shuffle(int seed, unsigned char* deck):
+    """ ShootMe's Shuffle1: 269 swaps of random pairs of a sorted deck """
+    cdef ShootMeRandom r
+    cdef int i, j, x
+    cdef unsigned char tmp
+    shootme_seed(&r, seed)
+    for i in range(NUM_CARDS):
+        deck[i] = i
+    for x in range(269):
+        i = shootme_next1(&r) % NUM_CARDS
+        j = shootme_next1(&r) % NUM_CARDS
+        tmp = deck[i]
+        deck[i] = deck[j]
+        deck[j] = tmp
+
+
+cdef void klon_deal(Klon* k, int seed):
+    # the deck is dealt a row at a time across the tableaus, starting each row
+    # one tableau further right and turning up its first card; the remaining
+    # 24 cards are the stock, the last dealt on the bottom
+    cdef unsigned char deck[NUM_CARDS]
+    cdef int seg, row, i, pos = 0
+    shootme_shuffle(seed, deck)
+    k.start[TALON] = 0
+    for i in range(NUM_CARDS - 1, 27, -1):
+        k.cards[pos] = deck[i]
+        pos += 1
+    k.split = pos
+    for seg in range(TABLEAU1, TABLEAU7 + 1):
+        k.start[seg] = pos
+        for row in range(seg):
+            i = row * 7 - row * (row - 1) // 2 + seg - 1 - row
+            k.cards[pos] = deck[i] if row == seg - 1 else deck[i] | FACE_DOWN
+            pos += 1
+    for seg in range(TABLEAU7 + 1, NUM_SEGMENTS + 1):  # empty foundations
+        k.start[seg] = pos
+    k.hash = klon_full_hash(k)
+
+
+def shootme_deal(int seed, packed=False):
+    """
+    the deal ShootMe plays for `seed`, as a KlonState (or PackedState)
+    """
+    cdef PackedState state = PackedState.__new__(PackedState)
+    klon_deal(&state.k, seed)
+    return state if packed else state.to_klonstate()
+
+
+def shootme_deals(int start, int stop, packed=False):
+    """ yields (seed, deal) for the seeds in range(start, stop) """
+    cdef int seed
+    cdef PackedState state
+    for seed in range(start, stop):
+        state = PackedState.__new__(PackedState)
+        klon_deal(&state.k, seed)
+        yield seed, (state if packed else state.to_klonstate())
+
+
+### EXHAUSTIVE SEARCH
+# Depth-first search over every legal move, remembering the Zobrist hash of
+# each state reached so no state is expanded twice. Exhausting the search
+# proves the deal impossible (under these rules: draw three, unlimited
+# passes through the talon), like ShootMe's "Impossible".
+
+DFSResult = namedtuple("DFSResult", ["result", "moveseq", "nodes"])
+
+cdef struct TTable:
+    unsigned long long* keys  # open addressing, 0 marks an empty slot
+    size_t mask
+    size_t count
+
+
+cdef int tt_init(TTable* tt, size_t size) except -1:
+    tt.keys = <unsigned long long*>PyMem_Malloc(size * sizeof(unsigned long long))
+    if tt.keys == NULL:
+        raise MemoryError()
+    memset(tt.keys, 0, size * sizeof(unsigned long long))
+    tt.mask = size - 1
+    tt.count = 0
+    return 0
+
+
+cdef int tt_add(TTable* tt, unsigned long long h) except -1:
+    """ adds h to the table, returns 0 if it was already there """
+    cdef size_t i
+    cdef unsigned long long* old_keys
+    cdef size_t old_size
+    if h == 0:
+        h = 1
+    i = h & tt.mask
+    while tt.keys[i] != 0:
+        if tt.keys[i] == h:
+            return 0
+        i = (i + 1) & tt.mask
+    tt.keys[i] = h
+    tt.count += 1
+    if 2 * tt.count > tt.mask:  # grow at half full
+        old_keys = tt.keys
+        old_size = tt.mask + 1
+        tt_init(tt, 2 * old_size)
+        for i in range(old_size):
+            if old_keys[i] != 0:
+                tt_add(tt, old_keys[i])
+        PyMem_Free(old_keys)
+    return 1
+
+
+cdef inline int tt_visit(TTable* tt, unsigned long long h) except -1:
+    """ tt_add, counted and timed in the search stats """
+    cdef double t
+    if not collect_stats:
+        return tt_add(tt, h)
+    t = clock()
+    cdef int added = tt_add(tt, h)
+    counters.hash_lookups += 1
+    counters.hashing_seconds += clock() - t
+    return added
+
+
+cdef int dfs_priority(Klon* k, int move_id):
+    """ rough desirability of a move, to try promising moves first """
+    cdef int kind = MOVE_KIND[move_id]
+    cdef int n
+    if kind == MOVE_TO_FOUNDATION or kind == MOVE_WASTE_FOUNDATION:
+        return 5
+    if kind == MOVE_TABLEAU:
+        n = packed_count_face_up(k, MOVE_SRC[move_id])
+        if MOVE_COUNT[move_id] == n and n < seg_len(k, MOVE_SRC[move_id]):
+            return 4  # turns up a face-down card
+        return 2
+    if kind == MOVE_WASTE_TABLEAU:
+        return 3
+    if kind == MOVE_DRAW:
+        return 1
+    return 0  # foundation to tableau
+
+
+cdef int ordered_legal_move_ids(Klon* k, int* out):
+    """ search_move_ids, most promising first """
+    cdef int i, j, m, p, count
+    cdef int priority[NUM_MOVES]
+    count = search_move_ids(k, out)
+    cdef double t = clock() if collect_stats else 0
+    for i in range(count):
+        priority[i] = dfs_priority(k, out[i])
+    # stable insertion sort, highest priority first
+    for i in range(1, count):
+        m, p = out[i], priority[i]
+        j = i - 1
+        while j >= 0 and priority[j] < p:
+            out[j + 1], priority[j + 1] = out[j], priority[j]
+            j -= 1
+        out[j + 1], priority[j + 1] = m, p
+    if collect_stats:
+        counters.scored_moves += count
+        counters.scoring_seconds += clock() - t
+    return count
+
+
+def solve_dfs(state, long max_nodes=1_000_000, max_seconds=None):
+    """
+    Exhaustive depth-first search for a solution.
+
+    returns DFSResult(result, moveseq, nodes), where result is "Solved"
+    (moveseq is then the solution's move codes), "Impossible", or "Unknown"
+    if max_nodes states were generated or max_seconds went by first.
+    """
+    cdef Klon root = pack_state(state).k
+    cdef Klon child
+    cdef TTable tt
+    cdef Klon* path = NULL     # path[d]: state at depth d
+    cdef int* moves = NULL     # legal moves of every state on the path
+    cdef int* first = NULL     # first[d]: index into moves for depth d
+    cdef int* cur = NULL       # cur[d]: next move to try at depth d
+    cdef int depth = 0, capacity = 256, count, m, i
+    cdef long nodes = 0
+    cdef double deadline = 0
+    result = "Impossible"
+    moveseq = ()
+
+    if packed_is_win(&root):
+        return DFSResult("Solved", (), 0)
+    if max_seconds is not None:
+        deadline = time.monotonic() + max_seconds
+    tt_init(&tt, 1 << 16)
+    try:
+        path = <Klon*>PyMem_Malloc(capacity * sizeof(Klon))
+        moves = <int*>PyMem_Malloc((capacity + 1) * NUM_MOVES * sizeof(int))
+        first = <int*>PyMem_Malloc((capacity + 1) * sizeof(int))
+        cur = <int*>PyMem_Malloc(capacity * sizeof(int))
+        if path == NULL or moves == NULL or first == NULL or cur == NULL:
+            raise MemoryError()
+        tt_add(&tt, root.hash)
+        path[0] = root
+        first[0] = cur[0] = 0
+        first[1] = ordered_legal_move_ids(&root, moves)
+
+        while depth >= 0:
+            if cur[depth] == first[depth + 1]:  # all moves tried: backtrack
+                depth -= 1
+                continue
+            m = moves[cur[depth]]
+            cur[depth] += 1
+            child = path[depth]
+            klon_apply(&child, m)
+            if not tt_visit(&tt, child.hash):
+                continue  # seen this state before
+            nodes += 1
+            if packed_is_win(&child):
+                result = "Solved"
+                moveseq = tuple([MOVE_CODES[moves[cur[i] - 1]] for i in range(depth + 1)])
+                break
+            if nodes >= max_nodes or (
+                deadline and nodes % 4096 == 0 and time.monotonic() > deadline
+            ):
+                result = "Unknown"
+                break
+            depth += 1
+            if depth == capacity:
+                capacity *= 2
+                path = <Klon*>grow_buffer(path, capacity * sizeof(Klon))
+                moves = <int*>grow_buffer(moves, (capacity + 1) * NUM_MOVES * sizeof(int))
+                first = <int*>grow_buffer(first, (capacity + 1) * sizeof(int))
+                cur = <int*>grow_buffer(cur, capacity * sizeof(int))
+            path[depth] = child
+            cur[depth] = first[depth]
+            count = ordered_legal_move_ids(&child, &moves[first[depth]])
+            first[depth + 1] = first[depth] + count
+    finally:
+        PyMem_Free(tt.keys)
+        PyMem_Free(path)
+        PyMem_Free(moves)
+        PyMem_Free(first)
+        PyMem_Free(cur)
+    return DFSResult(result, moveseq, nodes)
+
+
+cdef void* grow_buffer(void* buf, size_t size) except NULL:
+    cdef void* new_buf = PyMem_Realloc(buf, size)
+    if new_buf == NULL:
+        raise MemoryError()
+    return new_buf
+
+
+### GREEDY PLAYOUT
+
+Playout = namedtuple("Playout", ["solved", "moveseq", "visited", "msg"])
+
+
+def yan_et_al_playout(state, long max_states=50_000):
+    """
+    Plays the best move by yan_et_al_ranking until the game is won, a
+    state repeats, no move is left or max_states moves were made.
+
+    returns Playout(solved, moveseq, visited, msg) as the EndState of
+    policies.simulate_with_heuristic: moveseq holds the codes of the moves
+    played if solved (None otherwise)
+    """
+    cdef Klon k = pack_state(state).k
+    cdef TTable visited
+    cdef int ids[NUM_MOVES]
+    cdef int* path = NULL
+    cdef long i = 0, v, capacity = 256
+    cdef int count, action
+    solved, msg = False, None
+    tt_init(&visited, 1 << 12)
+    try:
+        path = <int*>grow_buffer(path, capacity * sizeof(int))
+        while True:
+            v = visited.count
+            if i >= max_states:
+                msg = "exceeded max states"
+                break
+            if not tt_visit(&visited, k.hash):
+                msg = "revisited state"
+                break
+            # Yan et al. Section 4 "Machine Play"
+            # 1. identify set of legal moves
+            # 2. select and execute a legal move
+            count = search_move_ids(&k, ids)
+            action = yan_et_al_best(&k, ids, count)
+            if action < 0:
+                msg = "run out of actions"
+                break
+            if i == capacity:
+                capacity *= 2
+                path = <int*>grow_buffer(path, capacity * sizeof(int))
+            path[i] = action
+            klon_apply(&k, action)
+            i += 1
+            # 3. If all cards are on suit stacks, declare victory and terminate.
+            if packed_is_win(&k):
+                solved = True
+                break
+            # 4. If new card configuration repeats a previous one, declare loss
+            #    and terminate.
+            # 5. Repeat procedure.
+        if collect_stats:
+            counters.playouts += 1
+            counters.playout_moves += i
+            counters.longest_playout = max(counters.longest_playout, i)
+        moveseq = tuple([MOVE_CODES[path[j]] for j in range(i)]) if solved else None
+        return Playout(solved, moveseq, v, msg)
+    finally:
+        PyMem_Free(visited.keys)
+        PyMem_Free(path)
@@ -0,0 +1,130 @@
+"""
+Parallel, resumable harvesting of ShootMe results.
+
+Runs the ShootMe solver on many seeds at once and writes each result into the
+`bench/shootme` cache (one `{seed}.txt` file per seed, as the notebooks name
+them). A file only appears once its result is complete, so an interrupted
+harvest resumes by skipping the seeds already in the cache.
+
+    python harvest.py 0 10000 --workers 8 --timeout 600
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from benchmarking import SHOOTME_BIN, run_shootme_seed, solve_state
+
+CACHE_DIR = "./bench/shootme"
+
+
+def cache_path(seed, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"{seed}.txt")
+
+
+def write_atomic(path, data):
+    """ writes `data` to a temporary file beside `path`, then renames it over `path` """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def harvest_seed(seed, cache_dir=CACHE_DIR, timeout=None, fast=False, binary=SHOOTME_BIN):
+    """ runs ShootMe on `seed` unless it is cached; returns a status string """
+    path = cache_path(seed, cache_dir)
+    if os.path.exists(path):
+        return "cached"
+    try:
+        ret = run_shootme_seed(seed, fast=fast, timeout=timeout, binary=binary)
+    except subprocess.TimeoutExpired:
+        return "timeout"
+    except OSError:
+        return "failed"
+    try:
+        if solve_state(ret) is None:
+            return "failed"
+    except IndexError:  # truncated output
+        return "failed"
+    write_atomic(path, ret)
+    return "harvested"
+
+
+def harvest(
+    seeds,
+    cache_dir=CACHE_DIR,
+    workers=None,
+    timeout=None,
+    fast=False,
+    binary=SHOOTME_BIN,
+    on_result=None,
+):
+    """
+    Harvests ShootMe results for `seeds`, running `workers` solvers at a time.
+    Seeds that time out or fail are not cached, so a later harvest retries them.
+    `on_result(seed, status)` is called as each seed finishes.
+    Returns a Counter of statuses.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    seeds = list(seeds)
+    todo = [s for s in seeds if not os.path.exists(cache_path(s, cache_dir))]
+    counts = Counter(cached=len(seeds) - len(todo))
+    # the solvers are subprocesses, so threads are enough to keep them all busy
+    pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+    futures = {}
+    try:
+        for seed in todo:
+            future = pool.submit(harvest_seed, seed, cache_dir, timeout, fast, binary)
+            futures[future] = seed
+        for future in as_completed(futures):
+            seed, status = futures[future], future.result()
+            counts[status] += 1
+            if on_result is not None:
+                on_result(seed, status)
+    finally:
+        # on an interrupt, don't start the seeds still queued
+        # (by hand: shutdown's cancel_futures needs Python 3.9)
+        for future in futures:
+            future.cancel()
+        pool.shutdown()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("start", type=int, help="first seed")
+    parser.add_argument("stop", type=int, help="last seed (exclusive)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per seed")
+    parser.add_argument("--fast", action="store_true", help="pass /FAST to ShootMe")
+    parser.add_argument("--binary", default=SHOOTME_BIN)
+    args = parser.parse_args(argv)
+
+    seeds = list(range(args.start, args.stop))
+    t0 = time.time()
+
+    def report(seed, status):
+        print(f"{time.time() - t0:8.1f}s  seed {seed:6}  {status}", flush=True)
+
+    counts = harvest(
+        seeds,
+        cache_dir=args.cache_dir,
+        workers=args.workers,
+        timeout=args.timeout,
+        fast=args.fast,
+        binary=args.binary,
+        on_result=report,
+    )
+    print(", ".join(f"{n:,} {status}" for status, n in sorted(counts.items())))
+
+
+if __name__ == "__main__":
+    main()
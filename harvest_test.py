@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import unittest
+from harvest import *
+
+
+SLOW_SEED = 1
+
+# Stands in for ShootMe: prints the fixture for the seed, if there is one.
+STAND_IN = f"""#!{sys.executable}
+import glob, sys, time
+seed = sys.argv[sys.argv.index("/G") + 1]
+if seed == "{SLOW_SEED}":
+    time.sleep(30)
+for path in glob.glob("{os.path.abspath('fixtures/shootme')}/*/" + seed + ".txt"):
+    print(open(path).read(), end="")
+"""
+
+
+class TestHarvest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.binary = os.path.join(self.tmpdir.name, "KlondikeSolver")
+        with open(self.binary, "w") as f:
+            f.write(STAND_IN)
+        os.chmod(self.binary, 0o755)
+        self.cache_dir = os.path.join(self.tmpdir.name, "shootme")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def harvest(self, seeds, **kwargs):
+        return harvest(seeds, cache_dir=self.cache_dir, binary=self.binary, **kwargs)
+
+    def test_harvests_and_resumes(self):
+        counts = self.harvest([12, 2591, 5], workers=2)
+        assert counts["harvested"] == 3
+        assert sorted(os.listdir(self.cache_dir)) == ["12.txt", "2591.txt", "5.txt"]
+        with open(os.path.join(self.cache_dir, "12.txt")) as f:
+            with open("fixtures/shootme/solvedmin/12.txt") as fixture:
+                assert f.read() == fixture.read()
+        counts = self.harvest([12, 2591, 5, 523], workers=2)
+        assert counts["cached"] == 3
+        assert counts["harvested"] == 1
+
+    def test_failures_are_not_cached(self):
+        results = []
+        counts = self.harvest(
+            [SLOW_SEED, 3, 12],
+            timeout=0.5,
+            on_result=lambda seed, status: results.append((seed, status)),
+        )
+        assert counts == {"timeout": 1, "failed": 1, "harvested": 1, "cached": 0}
+        assert sorted(results) == [(SLOW_SEED, "timeout"), (3, "failed"), (12, "harvested")]
+        assert os.listdir(self.cache_dir) == ["12.txt"]
+
+    def test_missing_binary(self):
+        counts = harvest([12], cache_dir=self.cache_dir, binary="./no/such/solver")
+        assert counts["failed"] == 1
+        assert os.listdir(self.cache_dir) == []
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,9 +3,9 @@ from gamestate import *
 
 class KlonTree:
     def __init__(self, root_state):
-        self.root_state = root_state
-        self.state = root_state
-        self.visited = set([self.state])
+        self.root_state = pack_state(root_state)
+        self.state = self.root_state
+        self.visited = set([state_hash(self.state)])
         self.path = []
 
     def print_root(self):
@@ -22,14 +22,14 @@ class KlonTree:
         children = ((play_move(self.state, move), move) for move in all_moves)
         filtered_moves = set()
         for s, a in children:
-            if s not in self.visited:
+            if state_hash(s) not in self.visited:
                 filtered_moves.add(a)
         return filtered_moves
 
     def make_move(self, move_code):
         new_state = play_move(self.state, move_code)
         self.state = new_state
-        self.visited.add(new_state)
+        self.visited.add(state_hash(new_state))
         self.path.append(move_code)
 
     def is_win(self):
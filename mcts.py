@@ -12,7 +12,9 @@ from decimal import *
 from gamestate import (
     KlonState,
     get_legal_moves,
+    move_code,
     play_move,
+    state_hash,
     state_is_win,
     to_pretty_string,
 )
@@ -109,15 +111,15 @@ class MCTS:
     def _simulate(self, node):
         "Returns the reward for a random simulation (to completion) of `node`"
         max_states = 1_000
-        visited = set([node])
+        visited = set([state_hash(node)])
         for _ in range(max_states):
             if node.is_terminal():
                 reward = node.reward()
                 return reward
-            if node in visited:  # cycle
+            if state_hash(node) in visited:  # cycle
                 return -1
             node = node.rollout_policy_child()
-            visited.add(node)
+            visited.add(state_hash(node))
         return Decimal("-0.1")  # reward for bailed out at state limit
 
     def _backpropagate(self, path, reward):
@@ -178,7 +180,7 @@ class KlondikeNode(KlonState):
         # return state.find_random_child()
         moves = yan_et_al_prioritized_actions(state)
         best_move = moves[0]
-        return state.make_move(best_move)
+        return state.make_move(move_code(best_move))
 
     def is_win(state):
         return state_is_win(state)
@@ -0,0 +1,164 @@
+"""
+Microbenchmarks of the gamestate hot primitives.
+
+Each benchmark runs one primitive over a fixed set of positions sampled from
+the solutions of the fixtures/shootme deals: a few warmup passes, then
+`repeats` timed passes. A pass's time divided by its number of calls gives
+one sample of the time per call; the report gives percentiles of those.
+
+    python microbench.py --save bench/microbench.json
+    python microbench.py --baseline bench/microbench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from benchmarking import git_revision, listdir, state_with_moveseq
+from gamestate import (
+    MOVE_IDS,
+    count_face_up,
+    draw,
+    get_legal_moves,
+    play_move,
+    state_is_legal,
+    state_is_win,
+)
+from tuplestate import TABLEAU1, TABLEAU7
+from vectorize import state_to_vec
+
+FIXTURE_DIRS = ["./fixtures/shootme/solved", "./fixtures/shootme/solvedmin"]
+PERCENTILES = (50, 90, 99)
+
+
+def sample_positions(n=500, seed=0):
+    """
+    (state, move) pairs: `n` positions from along the fixture solutions, each
+    with the solution move played from it. The same every run for a given seed.
+    """
+    pairs = []
+    for d in FIXTURE_DIRS:
+        for fname in sorted(listdir(d)):
+            state, moveseq = state_with_moveseq(fname)
+            for move in moveseq:
+                if move in MOVE_IDS:  # skip the no-op flips and NEW
+                    pairs.append((state, move))
+                state = play_move(state, move)
+    rng = random.Random(seed)
+    return rng.sample(pairs, min(n, len(pairs)))
+
+
+def primitives(positions):
+    """ name -> (function of one argument, arguments to call it with) """
+    states = [s for s, _ in positions]
+    piles = [s[t] for s in states for t in range(TABLEAU1, TABLEAU7 + 1)]
+    return {
+        "get_legal_moves": (get_legal_moves, states),
+        "play_move": (lambda sm: play_move(*sm), positions),
+        "draw": (draw, states),
+        "count_face_up": (count_face_up, piles),
+        "state_is_win": (state_is_win, states),
+        "state_is_legal": (state_is_legal, states),
+        "state_to_vec": (state_to_vec, states),
+    }
+
+
+def time_pass(fn, args):
+    start = time.perf_counter_ns()
+    for a in args:
+        fn(a)
+    return (time.perf_counter_ns() - start) / len(args)
+
+
+def run_benchmark(fn, args, warmup=2, repeats=20):
+    """ percentiles (and mean) of the nanoseconds per call, over `repeats` passes """
+    for _ in range(warmup):
+        time_pass(fn, args)
+    samples = np.array([time_pass(fn, args) for _ in range(repeats)])
+    result = {f"p{p}": float(np.percentile(samples, p)) for p in PERCENTILES}
+    result["mean"] = float(samples.mean())
+    result["calls"] = len(args)
+    result["repeats"] = repeats
+    return result
+
+
+def run_suite(names=None, positions=500, warmup=2, repeats=20):
+    benches = primitives(sample_positions(positions))
+    names = names or list(benches)
+    return {
+        "meta": {
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "datetime": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "positions": positions,
+        },
+        "results": {
+            name: run_benchmark(*benches[name], warmup=warmup, repeats=repeats)
+            for name in names
+        },
+    }
+
+
+def compare(results, baseline, threshold=0.10):
+    """
+    name -> ratio of the median time per call to the baseline's, for the
+    benchmarks in both; and the names slower than the baseline by more
+    than `threshold`
+    """
+    ratios = {
+        name: r["p50"] / baseline["results"][name]["p50"]
+        for name, r in results["results"].items()
+        if name in baseline["results"]
+    }
+    regressions = [name for name, ratio in ratios.items() if ratio > 1 + threshold]
+    return ratios, regressions
+
+
+def report(results, ratios=None):
+    cols = "".join(f"{'p' + str(p):>10}" for p in PERCENTILES)
+    print(f"{'ns per call':16}{cols}{'calls':>8}" + ("  vs baseline" if ratios else ""))
+    for name, r in results["results"].items():
+        pcts = "".join(f"{r['p' + str(p)]:10,.0f}" for p in PERCENTILES)
+        line = f"{name:16}{pcts}{r['calls']:8}"
+        if ratios and name in ratios:
+            line += f"  {ratios[name]:10.2f}x"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default all)")
+    parser.add_argument("--positions", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10, help="slowdown that counts as a regression"
+    )
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.names, args.positions, args.warmup, args.repeats)
+    ratios = regressions = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            ratios, regressions = compare(results, json.load(f), args.threshold)
+    report(results, ratios)
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print(f"regressions (> {args.threshold:.0%} slower): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
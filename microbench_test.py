@@ -0,0 +1,29 @@
+import unittest
+from microbench import *
+
+
+class TestMicrobench(unittest.TestCase):
+    def test_positions_are_fixed(self):
+        assert sample_positions(20) == sample_positions(20)
+        for state, move in sample_positions(20):
+            assert move in get_legal_moves(state)
+
+    def test_run_suite(self):
+        results = run_suite(["state_is_win", "draw"], positions=10, warmup=1, repeats=3)
+        assert sorted(results["results"]) == ["draw", "state_is_win"]
+        r = results["results"]["draw"]
+        assert r["calls"] == 10
+        assert 0 < r["p50"] <= r["p90"] <= r["p99"]
+
+    def test_compare(self):
+        def results(ns):
+            return {"results": {name: {"p50": t} for name, t in ns.items()}}
+
+        baseline = results({"draw": 100, "play_move": 100, "state_is_win": 100})
+        ratios, regressions = compare(results({"draw": 105, "play_move": 150}), baseline)
+        assert ratios == {"draw": 1.05, "play_move": 1.5}
+        assert regressions == ["play_move"]
+
+
+if __name__ == "__main__":
+    unittest.main()
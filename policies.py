@@ -1,5 +1,26 @@
 import re
-from gamestate import get_legal_moves, count_face_up, play_move, state_is_win
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from gamestate import (
+    MOVE_CODES,
+    MOVE_TABLEAU,
+    MOVE_TO_FOUNDATION,
+    MOVE_WASTE_TABLEAU,
+    MOVE_FOUNDATION_TABLEAU,
+    MOVE_DRAW,
+    LRUCache,
+    SearchState,
+    get_legal_moves_ids,
+    count_face_up,
+    move_id,
+    move_info,
+    pack_state,
+    play_move_id,
+    state_hash,
+    state_is_win,
+    yan_et_al_playout,
+    yan_et_al_ranking,
+)
 
 
 class EndState:
@@ -9,6 +30,12 @@ class EndState:
         self.visited = kwargs.get("visited", None)
         self.msg = kwargs.get("msg", None)
         self.impossible = kwargs.get("impossible", None)
+        self.k = kwargs.get("k", None)
+        self.stats = kwargs.get("stats", None)
+
+
+class OutOfTime(Exception):
+    """raised by a rollout given a deadline once the deadline has passed"""
 
 
 build2suit = re.compile(r"^([1-7])([CDSH])$")
@@ -37,20 +64,25 @@ def irange(lo, hi):
     return range(lo, hi + 1)
 
 
-def yan_et_al(move_code, state):
+def yan_et_al(move, state):
     """
+    move: move id (or move code)
     returns a tuple: (reward, priority)
         sorting a sequence of these tuples will sort by reward
         and then priority (to break ties)
+    gamestate.yan_et_al_scores is the compiled version, for many moves at once
     """
+    if isinstance(move, str):
+        move = move_id(move)
+    kind, src, dest, num = move_info(move)
     # Yan et al (2005)
     # - moved from a build stack to a suit stack, gain 5 points
     # - moved from the talon to a build stack, gain 5 points
     # - moved from a suit stack to a build stack, lose 10 points
     pri = 0  # default case for priority
-    if build2suit.match(move_code):
+    if kind == MOVE_TO_FOUNDATION:
         return (5, 0)
-    elif talon2build.match(move_code):
+    elif kind == MOVE_WASTE_TABLEAU:
         # If the card move is from the talon to a build stack, one of the
         # following three assignments of priority occurs:
         card = state.waste[-1]
@@ -82,16 +114,12 @@ def yan_et_al(move_code, state):
                         pri = -1
 
         return (5, pri)
-    elif suit2build.match(move_code):
+    elif kind == MOVE_FOUNDATION_TABLEAU:
         return (-10, pri)
     else:
         # If the card move is from a build stack to another build stack,
         # one of the following two assignments of priority occurs:
-        b2b_match = build2build.match(move_code)
-        if b2b_match:
-            src, dest, num = b2b_match.groups()
-            src = int(src)
-            num = 1 if num is None else int(num[1:])
+        if kind == MOVE_TABLEAU:
             faceup = count_face_up(state[src])
             facedown = len(state[src]) - faceup
             # – If the move turns an originally face-down card face-up,
@@ -105,88 +133,195 @@ def yan_et_al(move_code, state):
                 pri = 1
         # draw moves
         # penalize the ones that Yan et al wouldn't consider
-        if move_code.startswith("DR") and move_code != "DR1":
+        if kind == MOVE_DRAW and num != 1:
             pri = -1
 
         return (0, pri)
 
 
-def yan_et_al_prioritized_actions(state):
-    # produce the set of legal moves given this state
-    move_list = get_legal_moves(state)
-
-    # policy: function(move_code)
-    # - given a move code and the state, score the move.
-    # - taken over a set of moves, should order the moves by their desirability
-    policy = lambda mc: (yan_et_al(mc, state), mc)
-
-    return sorted(move_list, key=policy, reverse=True)
+def yan_et_al_prioritized_actions(state, move_list=None):
+    """
+    legal move ids, most desirable first
+    move_list: the legal move ids of state, if already known
+    """
+    # sorted by yan_et_al score, ties going to the greater move code
+    return yan_et_al_ranking(state, move_list)
 
 
 def simulate_with_heuristic(state, max_states=50_000):
-    visited = set()
-    moveseq = []
-    i = 0
-    while True:
-        v = len(visited)
-        if i >= max_states:
-            return EndState(solved=False, visited=v, msg="exceeded max states")
-        if state in visited:
-            return EndState(solved=False, msg="revisited state", visited=v)
-        visited.add(state)
-        # Yan et al. Section 4 "Machine Play"
-        # 1. identify set of legal moves
-        # 2. select and execute a legal move
-        actions = yan_et_al_prioritized_actions(state)
-        if len(actions) == 0:
-            return EndState(solved=False, visited=v, msg="run out of actions")
-        action = actions[0]
-        moveseq.append(action)
-        state = play_move(state, action)
-        # 3. If all cards are on suit stacks, declare victory and terminate.
-        if state_is_win(state):
-            return EndState(solved=True, moveseq=moveseq, visited=v)
-        # 4. If new card configuration repeats a previous one, declare loss and terminate.
-        # 5. Repeat procedure.
-        i += 1
+    """
+    greedy playout of the Yan et al. heuristic (Section 4 "Machine Play"),
+    see gamestate.yan_et_al_playout
+    """
+    result = yan_et_al_playout(state, max_states)
+    return EndState(
+        solved=result.solved,
+        moveseq=None if result.moveseq is None else list(result.moveseq),
+        visited=result.visited,
+        msg=result.msg,
+    )
 
 
 def yan_et_al_rollout_1(state):
-    moves = get_legal_moves(state)
+    search = SearchState(state)
+    moves = search.legal_moves()
     for move in moves:
-        new_state = play_move(state, move)
-        result = simulate_with_heuristic(new_state)
+        search.do_move(move)
+        result = simulate_with_heuristic(search)
+        search.undo_move()
         if result.solved:
             return EndState(
                 solved=True,
                 msg="solved in rollout",
                 visited=result.visited,
-                moveseq=(move,) + tuple(result.moveseq),
+                moveseq=(MOVE_CODES[move],) + tuple(result.moveseq),
             )
     # no optimal move: use the strategy as before
-    actions = yan_et_al_prioritized_actions(state)
+    actions = yan_et_al_prioritized_actions(search, moves)
     if len(actions) == 0:
         return None
     return actions[0]
 
 
-def yan_et_al_rollout(state, k):
-    moves = get_legal_moves(state)
+# default size bound of a rollout cache, in entries
+ROLLOUT_CACHE_SIZE = 200_000
+NOT_CACHED = object()
+
+
+def cached(cache, key, compute):
+    """ cache[key], calling compute() to fill it in if missing """
+    if cache is None:
+        return compute()
+    result = cache.get(key, NOT_CACHED)
+    if result is NOT_CACHED:
+        result = compute()
+        cache.put(key, result)
+    return result
+
+
+def yan_et_al_rollout(state, k, cache=None, pool=None, deadline=None):
+    """
+    returns an EndState if some rollout solved the game,
+    otherwise the id of the move the heuristic prefers (None if there is none)
+    cache: optional LRUCache of rollout results by (k, state hash), to share
+        between the levels of the rollout and between solver steps
+    pool: optional concurrent.futures executor (of processes) to spread the
+        rollouts of the children over; the result is the same as without
+    deadline: optional time.monotonic() time after which OutOfTime is raised
+        (an interrupted rollout leaves nothing in the cache)
+    """
+    # nested rollouts share one search state, stepping in and out of moves
+    search = state if isinstance(state, SearchState) else SearchState(state)
+    if pool is not None:
+        rollout = lambda: _parallel_rollout(search, k, cache, pool, deadline)
+    else:
+        rollout = lambda: _yan_et_al_rollout(search, k, cache, deadline)
+    return cached(cache, (k, search.zhash), rollout)
+
+
+def is_solved(result):
+    return hasattr(result, "solved") and result.solved
+
+
+def solved_through(move, result):
+    return EndState(
+        solved=True,
+        msg="solved in rollout",
+        visited=result.visited,
+        moveseq=(MOVE_CODES[move],) + tuple(result.moveseq),
+    )
+
+
+def check_deadline(deadline):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise OutOfTime()
+
+
+def _yan_et_al_rollout(search, k, cache, deadline=None):
+    moves = search.legal_moves()
     for move in moves:
-        new_state = play_move(state, move)
+        check_deadline(deadline)
+        search.do_move(move)
         if k > 1:
-            result = yan_et_al_rollout(new_state, k - 1)
+            result = yan_et_al_rollout(search, k - 1, cache, deadline=deadline)
         elif k == 1:
-            result = simulate_with_heuristic(new_state)
-        if hasattr(result, "solved") and result.solved:
-            return EndState(
-                solved=True,
-                msg="solved in rollout",
-                visited=result.visited,
-                moveseq=(move,) + tuple(result.moveseq),
+            result = cached(
+                cache, (0, search.zhash), lambda: simulate_with_heuristic(search)
             )
+        search.undo_move()
+        if is_solved(result):
+            return solved_through(move, result)
     # no optimal move: use the strategy as before
-    actions = yan_et_al_prioritized_actions(state)
+    actions = yan_et_al_prioritized_actions(search, moves)
     if len(actions) == 0:
         return None
     return actions[0]
+
+
+def _parallel_rollout(search, k, cache, pool, deadline=None):
+    # Children are rolled out concurrently but, as in the sequential
+    # rollout, the first child in move order that solves the game wins:
+    # once one has, rollouts of later children are cancelled (or abandoned
+    # if they are running), while those of earlier children are awaited.
+    moves = search.legal_moves()
+    state = search.packed()
+    results = {}
+    pending = {}  # future: (index of the child, cache key)
+    for i, move in enumerate(moves):
+        search.do_move(move)
+        key = (k - 1 if k > 1 else 0, search.zhash)
+        search.undo_move()
+        result = cache.get(key, NOT_CACHED) if cache is not None else NOT_CACHED
+        if result is NOT_CACHED:
+            pending[pool.submit(child_rollout, state, move, k)] = (i, key)
+        else:
+            results[i] = result
+    first_solved = min((i for i, r in results.items() if is_solved(r)), default=None)
+    try:
+        while pending:
+            if first_solved is not None:
+                for future, (i, key) in list(pending.items()):
+                    if i > first_solved:
+                        future.cancel()
+                        del pending[future]
+                if not pending:
+                    break
+            check_deadline(deadline)
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - time.monotonic(), 0)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, key = pending.pop(future)
+                results[i] = future.result()
+                if cache is not None:
+                    cache.put(key, results[i])
+                if is_solved(results[i]):
+                    first_solved = i if first_solved is None else min(i, first_solved)
+    finally:
+        for future in pending:
+            future.cancel()
+    if first_solved is not None:
+        return solved_through(moves[first_solved], results[first_solved])
+    actions = yan_et_al_prioritized_actions(search, moves)
+    if len(actions) == 0:
+        return None
+    return actions[0]
+
+
+# rollout results of a pool worker process, kept between tasks
+worker_cache = None
+
+
+def child_rollout(state, move, k):
+    """ pool task: rollout (at level k - 1) of the child reached by `move` """
+    global worker_cache
+    if worker_cache is None:
+        worker_cache = LRUCache(ROLLOUT_CACHE_SIZE)
+    search = SearchState(state)
+    search.do_move(move)
+    if k > 1:
+        return yan_et_al_rollout(search, k - 1, worker_cache)
+    return cached(
+        worker_cache, (0, search.zhash), lambda: simulate_with_heuristic(search)
+    )
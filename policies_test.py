@@ -1,4 +1,6 @@
 from policies import *
+from gamestate import KlonState, play_move, state_is_win, yan_et_al_scores
+from benchmarking import state_with_moveseq
 import unittest
 
 
@@ -67,6 +69,60 @@ class TestSolver(unittest.TestCase):
         self.assertIsNone(drawmove.match("W1"))
         self.assertIsNone(drawmove.match("11"))
 
+    def test_compiled_scores_match_yan_et_al(self):
+        state, moveseq = state_with_moveseq("./fixtures/shootme/solved/49.txt")
+        for move in moveseq:
+            moves = get_legal_moves_ids(state)
+            expected = [yan_et_al(m, state) for m in moves]
+            self.assertEqual(yan_et_al_scores(state, moves), expected)
+            ranked = sorted(
+                moves, key=lambda m: (yan_et_al(m, state), MOVE_CODES[m]), reverse=True
+            )
+            self.assertEqual(list(yan_et_al_prioritized_actions(state)), ranked)
+            state = play_move(state, move)
+
+    def test_simulate_with_heuristic(self):
+        state, _ = state_with_moveseq("./fixtures/shootme/solvedmin/47.txt")
+        result = simulate_with_heuristic(state)
+        self.assertTrue(result.solved)
+        self.assertEqual(result.visited, len(result.moveseq) - 1)
+        for move in result.moveseq:
+            self.assertFalse(state_is_win(state))
+            state = play_move(state, move)
+        self.assertTrue(state_is_win(state))
+
+    def test_simulate_with_heuristic_gives_up(self):
+        state, _ = state_with_moveseq("./fixtures/shootme/solvedmin/1238.txt")
+        result = simulate_with_heuristic(state)
+        self.assertFalse(result.solved)
+        self.assertEqual(result.msg, "revisited state")
+        self.assertEqual(result.visited, 44)
+        self.assertIsNone(result.moveseq)
+        result = simulate_with_heuristic(state, max_states=10)
+        self.assertEqual((result.msg, result.visited), ("exceeded max states", 10))
+
+    def test_yan_et_al_king_priority(self):
+        state = KlonState(
+            stock=("QS",),
+            waste=("KH", "KS"),
+            tableau1=(),
+            tableau2=("qh", "5C"),
+            **{f"tableau{t}": () for t in range(3, 8)},
+            foundation1=(),
+            foundation2=(),
+            foundation3=(),
+            foundation4=(),
+        )
+        self.assertEqual(yan_et_al("W1", state), (5, 1))  # queen in the stock
+        self.assertEqual(yan_et_al_scores(state, [move_id("W1")]), [(5, 1)])
+        state = state._replace(waste=("KS", "KH"))
+        self.assertEqual(yan_et_al("W1", state), (5, -1))  # queen face-down
+        self.assertEqual(yan_et_al_scores(state, [move_id("W1")]), [(5, -1)])
+        state = state._replace(tableau2=("5C",))
+        self.assertEqual(yan_et_al("W1", state), (5, 0))  # no queen at all
+        for _ in range(3):
+            self.assertEqual(yan_et_al_scores(state, [move_id("W1")]), [(5, 0)])
+
 
 if __name__ == "__main__":
     unittest.main()
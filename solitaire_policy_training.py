@@ -5,6 +5,7 @@ from gamestate import *
 from benchmarking import *
 from vectorize import *
 from klon_tree import KlonTree
+from corpus import Corpus
 
 MAX_DATA = 100
 SEED = 0
@@ -18,8 +19,8 @@ def seed_sequence(all_seeds):
         yield s
 
 
-def state_best_action_vec(seed):
-    state, seq = state_with_moveseq(f"./bench/shootme/{seed}")
+def state_best_action_vec(seed, corpus):
+    state, seq = state_with_moveseq(seed, corpus)
     while len(seq) > 0:
         action = seq.pop()
         state_vec = state_to_vec(state)
@@ -29,13 +30,14 @@ def state_best_action_vec(seed):
 
 
 if __name__ == "__main__":
-    all_seeds = clf_seeds(all_solutions)
+    corpus = Corpus("./bench/shootme.corpus")
+    all_seeds = clf_seeds(corpus.seeds(), corpus=corpus)
 
     data = []
     for seed in itertools.islice(seed_sequence(all_seeds), MAX_DATA):
-        state_actions = state_best_action_vec(seed)
+        state_actions = state_best_action_vec(seed, corpus)
         for s, a in state_actions:
-            if all_cards_faceup(vec_to_state(s)):
+            if face_down_counts(s[np.newaxis])[0] == 0:  # all cards face up
                 continue
             data.append((s, a))
 
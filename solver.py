@@ -1,37 +1,264 @@
+import heapq
 import sys
 import time
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from tuplestate import *
 from timebudget import timebudget
 from policies import *
+from gamestate import (
+    disable_search_stats,
+    enable_search_stats,
+    search_stats,
+    solve_dfs,
+    yan_et_al_scores,
+)
 
 
 sys.setrecursionlimit(10 ** 6)
 
 
-def solve(state, max_states=50_000, **solver_params):
+def solve(
+    state,
+    max_states=50_000,
+    rollout_cache_size=ROLLOUT_CACHE_SIZE,
+    workers=None,
+    stats=False,
+    on_stats=None,
+    **solver_params,
+):
+    """
+    rollout_cache_size: bound on the rollout results remembered across steps
+        (0 disables the cache)
+    workers: number of processes to run the rollouts of each step's
+        children in (the solution does not depend on it)
+    stats: attach the stats of the search (see StatsRecorder) to the EndState
+        as `stats`; those of rollouts run by workers are not counted
+    on_stats: callable given the stats so far after every step (and the
+        final ones at the end); implies stats
+    """
+    cache = LRUCache(rollout_cache_size) if rollout_cache_size else None
+    with rollout_pool(workers) as pool, recording(stats, cache, on_stats) as recorder:
+        result = _solve(state, max_states, cache, pool, solver_params, recorder=recorder)
+        return recorder.attach(result) if recorder else result
+
+
+def solve_anytime(
+    state,
+    time_budget,
+    max_k=10,
+    max_states=50_000,
+    rollout_cache_size=ROLLOUT_CACHE_SIZE,
+    workers=None,
+    stats=False,
+    on_stats=None,
+):
+    """
+    Solve with rollouts of depth k = 1, 2, ... until one solves the deal,
+    max_k has been tried or time_budget seconds have passed.
+    Every depth shares one rollout cache, so a deeper solve starts from
+    the rollouts of the shallower ones.
+    returns the first solution found, otherwise the EndState of the deepest
+    solve that finished in time (`k` tells which), or an EndState with msg
+    "out of time" if not even k=1 did
+    """
+    deadline = time.monotonic() + time_budget
+    cache = LRUCache(rollout_cache_size) if rollout_cache_size else None
+    best = EndState(solved=False, msg="out of time", visited=0)
+    with rollout_pool(workers) as pool, recording(stats, cache, on_stats) as recorder:
+        for k in range(1, max_k + 1):
+            try:
+                result = _solve(
+                    state, max_states, cache, pool, {"k": k}, deadline, recorder
+                )
+            except OutOfTime:
+                break
+            result.k = k
+            best = result
+            if result.solved:
+                break
+        return recorder.attach(best) if recorder else best
+
+
+class StatsRecorder:
+    """
+    Stats of a solve, as a dict of
+     - the fields of gamestate.search_stats(), counted from the start of the
+       solve: states generated, legal move generations, moves scored,
+       visited-table lookups, greedy playouts (the rollouts' leaves) and
+       their moves, and seconds spent in move generation, scoring and
+       hashing (longest_playout is since the stats were turned on)
+     - mean_playout: the mean number of moves per playout
+     - steps: heuristic solver steps (moves chosen by a rollout, or depths
+       searched by solve_beam); moves replayed from a rollout's solution
+       are not steps, and the states they reach are not counted
+     - cache_hits and cache_misses of the rollout cache
+     - seconds: the wall time since the solve started
+    """
+
+    def __init__(self, cache=None, on_stats=None):
+        self.cache = cache
+        self.on_stats = on_stats
+        self.steps = 0
+        self.replayed = 0  # states reached replaying a solution, not searching
+        self.started = time.monotonic()
+        self.start = search_stats()
+        self.cache_start = (cache.hits, cache.misses) if cache is not None else None
+
+    def snapshot(self):
+        now = search_stats()
+        stats = {
+            field: now[i] - self.start[i] for i, field in enumerate(now._fields)
+        }
+        stats["longest_playout"] = now.longest_playout
+        stats["states"] -= self.replayed
+        stats["mean_playout"] = stats["playout_moves"] / max(stats["playouts"], 1)
+        stats["steps"] = self.steps
+        stats["cache_hits"] = stats["cache_misses"] = 0
+        if self.cache is not None:
+            stats["cache_hits"] = self.cache.hits - self.cache_start[0]
+            stats["cache_misses"] = self.cache.misses - self.cache_start[1]
+        stats["seconds"] = time.monotonic() - self.started
+        return stats
+
+    def step(self):
+        self.steps += 1
+        if self.on_stats is not None:
+            self.on_stats(self.snapshot())
+
+    def attach(self, result):
+        result.stats = self.snapshot()
+        if self.on_stats is not None:
+            self.on_stats(result.stats)
+        return result
+
+
+@contextmanager
+def recording(stats, cache=None, on_stats=None):
+    """
+    a StatsRecorder, with the search stats on, if stats or on_stats;
+    the stats are left on afterwards if they were on before
+    """
+    if not stats and on_stats is None:
+        yield None
+        return
+    was_on = enable_search_stats()
+    try:
+        yield StatsRecorder(cache, on_stats)
+    finally:
+        if not was_on:
+            disable_search_stats()
+
+
+@contextmanager
+def rollout_pool(workers):
+    if not workers or workers <= 1:
+        yield None
+        return
+    pool = ProcessPoolExecutor(workers)
+    try:
+        yield pool
+    finally:
+        # the rollouts cancel their own queued futures as they unwind
+        # (cancel_futures needs Python 3.9)
+        pool.shutdown(wait=False)
+
+
+SolveStep = namedtuple("SolveStep", ["move", "state", "step", "seconds", "stats"])
+
+
+def solve_iter(
+    state,
+    max_states=50_000,
+    rollout_cache_size=ROLLOUT_CACHE_SIZE,
+    workers=None,
+    stats=False,
+    on_stats=None,
+    **solver_params,
+):
+    """
+    `solve`, yielding each move as soon as it is committed to as
+    SolveStep(move, state, step, seconds, stats): its code, the state it
+    leads to, its number (from 1), the seconds since the start and, with
+    stats, the stats so far. The moves of a solution found by a rollout
+    are all yielded at once.
+    returns the EndState (the value of StopIteration, or of `yield from`);
+    closing the generator cancels the solve.
+    """
+    cache = LRUCache(rollout_cache_size) if rollout_cache_size else None
+    with rollout_pool(workers) as pool, recording(stats, cache, on_stats) as recorder:
+        result = yield from _solve_steps(
+            state, max_states, cache, pool, solver_params, recorder=recorder
+        )
+        return recorder.attach(result) if recorder else result
+
+
+def _solve(*args, **kwargs):
+    steps = _solve_steps(*args, **kwargs)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _solve_steps(
+    state, max_states, cache, pool, solver_params, deadline=None, recorder=None
+):
+    started = time.monotonic()
+    state = pack_state(state)
     visited = set()
     moveseq = []
     i = 0
+
+    def committed(move, state, stats=None):
+        if stats is None and recorder is not None:
+            stats = recorder.snapshot()
+        seconds = time.monotonic() - started
+        return SolveStep(move, state, len(moveseq), seconds, stats)
+
     while True:
+        check_deadline(deadline)
         v = len(visited)
         if i >= max_states:
             return EndState(solved=False, visited=v, msg="exceeded max states")
-        if state in visited:
+        h = state_hash(state)
+        if h in visited:
             return EndState(solved=False, msg="revisited state", visited=v)
-        visited.add(state)
+        visited.add(h)
         # Yan et al. Section 4 "Machine Play"
         # 1. identify set of legal moves
-        result = yan_et_al_rollout(state, **solver_params)
+        result = yan_et_al_rollout(
+            state, cache=cache, pool=pool, deadline=deadline, **solver_params
+        )
         # 2. select and execute a legal move
         if result is None:
             return EndState(solved=False, msg="no avail moves", visited=v)
         if hasattr(result, "solved"):
-            return result  # solved in rollout
+            # solved in rollout, from the state reached after `moveseq`;
+            # replaying the solution is no search, so its steps all carry
+            # the stats from when it was found
+            stats = recorder.snapshot() if recorder is not None else None
+            for move in result.moveseq:
+                moveseq.append(move)
+                state = play_move_id(state, move_id(move))
+                if recorder is not None:
+                    recorder.replayed += 1
+                yield committed(move, state, stats)
+            return EndState(
+                solved=True,
+                msg=result.msg,
+                visited=result.visited,
+                moveseq=tuple(moveseq),
+            )
         # otherwise the rollout gives the old heuristic strategy
         action = result
-        moveseq.append(action)
-        state = play_move(state, action)
+        moveseq.append(MOVE_CODES[action])
+        state = play_move_id(state, action)
+        if recorder is not None:
+            recorder.step()
+        yield committed(MOVE_CODES[action], state)
         # 3. If all cards are on suit stacks, declare victory and terminate.
         if state_is_win(state):
             return EndState(solved=True, moveseq=moveseq, visited=v)
@@ -40,6 +267,107 @@ def solve(state, max_states=50_000, **solver_params):
         i += 1
 
 
+# weights of the state evaluation added to the Yan et al. move score in beam search
+FOUNDATION_WEIGHT = 5
+FACE_DOWN_WEIGHT = 5
+
+
+def state_evaluation(state):
+    """ progress of a state: cards on the foundations less face-down cards """
+    foundation = sum(len(state[f]) for f in range(FOUNDATION_C, FOUNDATION_H + 1))
+    face_down = 0
+    for tab in range(TABLEAU1, TABLEAU7 + 1):
+        pile = state[tab]
+        face_down += len(pile) - count_face_up(pile)
+    return FOUNDATION_WEIGHT * foundation - FACE_DOWN_WEIGHT * face_down
+
+
+def solve_beam(
+    state,
+    beam_width=100,
+    max_depth=1_000,
+    max_seen=1_000_000,
+    stats=False,
+    on_stats=None,
+):
+    """
+    Beam search: of the children of each depth's states, keeps the
+    beam_width best by the Yan et al. score (reward + priority) of the move
+    plus the state_evaluation of the child, skipping states seen before.
+    max_seen: bound on the state hashes remembered for deduplication, so
+        memory use is bounded by beam_width and max_seen
+    stats, on_stats: as for `solve`, a step being a depth
+    """
+    with recording(stats, None, on_stats) as recorder:
+        result = _solve_beam(state, beam_width, max_depth, max_seen, recorder)
+        return recorder.attach(result) if recorder else result
+
+
+def _solve_beam(state, beam_width, max_depth, max_seen, recorder):
+    state = pack_state(state)
+    seen = LRUCache(max_seen)
+    seen.put(state_hash(state), True)
+    beam = [(state, None)]  # (state, (last move, parent's path) or None)
+    visited = 1
+    for _ in range(max_depth):
+        candidates = []
+        for parent, path in beam:
+            moves = get_legal_moves_ids(parent)
+            for move, (reward, pri) in zip(moves, yan_et_al_scores(parent, moves)):
+                child = play_move_id(parent, move)
+                h = state_hash(child)
+                if h in seen:
+                    continue
+                seen.put(h, True)
+                visited += 1
+                child_path = (move, path)
+                if state_is_win(child):
+                    return EndState(
+                        solved=True,
+                        msg="solved in beam search",
+                        visited=visited,
+                        moveseq=path_moves(child_path),
+                    )
+                score = state_evaluation(child) + reward + pri
+                candidates.append((score, child, child_path))
+        if not candidates:
+            return EndState(solved=False, msg="beam exhausted", visited=visited)
+        best = heapq.nlargest(beam_width, candidates, key=lambda c: c[0])
+        beam = [(child, path) for _, child, path in best]
+        if recorder is not None:
+            recorder.step()
+    return EndState(solved=False, msg="exceeded max depth", visited=visited)
+
+
+def path_moves(path):
+    moves = []
+    while path is not None:
+        move, path = path
+        moves.append(MOVE_CODES[move])
+    return moves[::-1]
+
+
+def solve_exhaustive(
+    state, max_nodes=1_000_000, max_seconds=None, stats=False, on_stats=None
+):
+    """
+    Complete depth-first search (see gamestate.solve_dfs).
+    Unlike `solve`, a failed search that ran to the end proves the deal
+    impossible; `msg` holds the ShootMe-style Solved/Impossible/Unknown.
+    stats, on_stats: as for `solve`, on_stats being only given the final stats
+    """
+    with recording(stats, None, on_stats) as recorder:
+        result = solve_dfs(state, max_nodes=max_nodes, max_seconds=max_seconds)
+        result = EndState(
+            solved=result.result == "Solved",
+            impossible=result.result == "Impossible",
+            moveseq=list(result.moveseq),
+            visited=result.nodes,
+            msg=result.result,
+        )
+        return recorder.attach(result) if recorder else result
+
+
 if __name__ == "__main__":
     from benchmarking import convert_shootme_to_solvitaire_json
 
@@ -53,7 +381,12 @@ if __name__ == "__main__":
         print(fname)
         deck_json = convert_shootme_to_solvitaire_json(ret)
         state = init_from_solvitaire(deck_json)
-        solution = solve(state, max_states=100_000, k=1)
+        solution = solve(state, max_states=100_000, k=1, stats=True)
+        stats = solution.stats
+        print(
+            f"{stats['states']} states generated, {stats['playouts']} playouts "
+            f"(mean {stats['mean_playout']:.1f} moves) in {stats['seconds']:.3f}s"
+        )
         # print()
         if solution.solved:
             moveseq = list(solution.moveseq)
@@ -1,11 +1,36 @@
 import os
+import time
 import pytest
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from flaky import flaky
 from timeout_decorator import timeout, TimeoutError
-from solver import solve
-from tuplestate import init_from_ui_state, init_from_solvitaire
-from gamestate import state_is_win, copy, play_move
+from solver import (
+    solve,
+    solve_anytime,
+    solve_beam,
+    solve_exhaustive,
+    solve_iter,
+    state_evaluation,
+)
+from tuplestate import init_from_ui_state, init_from_solvitaire, to_ui_state
+from gamestate import (
+    LRUCache,
+    copy,
+    dead_end_info,
+    disable_auto_foundation,
+    disable_dead_end_pruning,
+    disable_search_stats,
+    enable_auto_foundation,
+    enable_dead_end_pruning,
+    enable_search_stats,
+    move_code,
+    play_move,
+    search_stats,
+    state_is_dead_end,
+    state_is_win,
+)
+from policies import OutOfTime, yan_et_al_rollout
 from benchmarking import convert_shootme_to_solvitaire_json
 
 
@@ -101,5 +126,268 @@ class TestSolver(unittest.TestCase):
         self.assertTrue(validate_move_seq(state, solution))
 
 
+def shootme_fixture(name):
+    with open(f"./fixtures/shootme/{name}") as f:
+        ret = f.read()
+    return init_from_solvitaire(convert_shootme_to_solvitaire_json(ret))
+
+
+class TestRolloutCache(unittest.TestCase):
+    def test_cache_does_not_change_solution(self):
+        state = shootme_fixture("solvedmin/12.txt")
+        uncached = solve(state, k=2, rollout_cache_size=0)
+        result = solve(state, k=2)
+        self.assertTrue(result.solved)
+        self.assertEqual(result.moveseq, uncached.moveseq)
+        self.assertTrue(validate_move_seq(state, result.moveseq))
+
+    def test_nested_rollouts_reuse_results(self):
+        state = shootme_fixture("solvedmin/1238.txt")
+        cache = LRUCache(maxsize=10_000)
+        first = yan_et_al_rollout(state, 2, cache=cache)
+        misses = cache.misses
+        self.assertGreater(cache.hits, 0)
+        self.assertEqual(yan_et_al_rollout(state, 2, cache=cache), first)
+        self.assertEqual(cache.misses, misses)
+        self.assertEqual(yan_et_al_rollout(state, 2), first)
+        small = LRUCache(maxsize=5)
+        self.assertEqual(yan_et_al_rollout(state, 2, cache=small), first)
+        self.assertEqual(len(small), 5)
+
+
+class TestParallelRollouts(unittest.TestCase):
+    def test_parallel_solve_matches_sequential(self):
+        for fixture in ["solvedmin/12.txt", "solvedmin/1238.txt"]:
+            state = shootme_fixture(fixture)
+            expected = solve(state, k=1)
+            result = solve(state, k=1, workers=2)
+            self.assertEqual(result.solved, expected.solved)
+            self.assertEqual(result.msg, expected.msg)
+            self.assertEqual(result.moveseq, expected.moveseq)
+
+    def test_pool_rollout_matches_sequential(self):
+        state = shootme_fixture("solved/49.txt")
+        with ThreadPoolExecutor(4) as pool:
+            for _ in range(20):
+                expected = yan_et_al_rollout(state, 1)
+                result = yan_et_al_rollout(state, 1, cache=LRUCache(100), pool=pool)
+                if hasattr(expected, "solved"):
+                    self.assertEqual(result.moveseq, expected.moveseq)
+                    break
+                self.assertEqual(result, expected)
+                state = play_move(state, move_code(expected))
+
+
+class TestAnytimeSolver(unittest.TestCase):
+    def test_raises_k_until_solved(self):
+        state = shootme_fixture("solvedmin/2951.txt")
+        self.assertFalse(solve(state, k=1).solved)
+        result = solve_anytime(state, time_budget=60)
+        self.assertTrue(result.solved)
+        self.assertEqual(result.k, 2)
+        self.assertEqual(result.moveseq, solve(state, k=2).moveseq)
+        self.assertTrue(validate_move_seq(state, result.moveseq))
+
+    def test_returns_deepest_result_when_unsolved(self):
+        state = shootme_fixture("solvedmin/1238.txt")
+        result = solve_anytime(state, time_budget=60, max_k=2)
+        self.assertFalse(result.solved)
+        self.assertEqual(result.k, 2)
+        self.assertEqual(result.msg, solve(state, k=2).msg)
+
+    def test_out_of_time(self):
+        state = shootme_fixture("solvedmin/1238.txt")
+        result = solve_anytime(state, time_budget=0)
+        self.assertFalse(result.solved)
+        self.assertEqual(result.msg, "out of time")
+        self.assertIsNone(result.k)
+        with self.assertRaises(OutOfTime):
+            yan_et_al_rollout(state, 2, deadline=time.monotonic())
+
+
+class TestBeamSolver(unittest.TestCase):
+    def test_solves_seed_1238(self):
+        state = shootme_fixture("solvedmin/1238.txt")
+        self.assertFalse(solve(state, k=2).solved)
+        result = solve_beam(state, beam_width=50)
+        self.assertTrue(result.solved)
+        self.assertTrue(validate_move_seq(state, result.moveseq))
+        self.assertEqual(solve_beam(state, beam_width=50).moveseq, result.moveseq)
+
+    def test_unsolved(self):
+        state = shootme_fixture("impossible/2591.txt")
+        self.assertEqual(solve_beam(state, beam_width=10).msg, "beam exhausted")
+        state = shootme_fixture("solvedmin/1238.txt")
+        result = solve_beam(state, beam_width=10, max_depth=5)
+        self.assertEqual(result.msg, "exceeded max depth")
+        self.assertFalse(result.solved)
+
+    def test_state_evaluation(self):
+        state = shootme_fixture("solvedmin/12.txt")
+        self.assertEqual(state_evaluation(state), -5 * 21)
+
+
+class TestDeadEnds(unittest.TestCase):
+    def test_solutions_pass_no_dead_ends(self):
+        for fixture in ["solvedmin/12.txt", "solvedmin/47.txt"]:
+            state = shootme_fixture(fixture)
+            result = solve(state, k=2)
+            self.assertTrue(result.solved)
+            for move in result.moveseq:
+                self.assertFalse(state_is_dead_end(state))
+                state = play_move(state, move)
+
+    def test_pruning_keeps_results(self):
+        state = shootme_fixture("solvedmin/1238.txt")
+        expected = solve(state, k=1)
+        enable_dead_end_pruning()
+        try:
+            result = solve(state, k=1)
+            self.assertEqual(solve_exhaustive(state).msg, "Solved")
+            self.assertGreater(dead_end_info().checks, 0)
+        finally:
+            disable_dead_end_pruning()
+        self.assertEqual(result.solved, expected.solved)
+        self.assertEqual(result.moveseq, expected.moveseq)
+
+
+class TestStreamingSolve(unittest.TestCase):
+    def collect(self, steps):
+        moves = []
+        while True:
+            try:
+                moves.append(next(steps))
+            except StopIteration as stop:
+                return moves, stop.value
+
+    def test_yields_the_moves_of_solve(self):
+        for fixture in ["solvedmin/2951.txt", "solvedmin/12.txt"]:
+            state = shootme_fixture(fixture)
+            expected = solve(state, k=2)
+            steps, result = self.collect(solve_iter(state, k=2))
+            self.assertEqual(result.solved, expected.solved)
+            self.assertEqual(result.msg, expected.msg)
+            self.assertEqual([s.move for s in steps], list(expected.moveseq or ()))
+            self.assertEqual([s.step for s in steps], list(range(1, len(steps) + 1)))
+            if result.solved:
+                self.assertTrue(state_is_win(steps[-1].state))
+                self.assertEqual(list(result.moveseq), [s.move for s in steps])
+
+    def test_replayed_solution_steps(self):
+        state = shootme_fixture("solvedmin/12.txt")
+        steps, result = self.collect(solve_iter(state, k=2, stats=True))
+        self.assertTrue(result.solved)
+        searched = steps[-1].stats["steps"]
+        self.assertLess(searched, len(steps))
+        replayed = steps[searched:]
+        self.assertTrue(all(s.stats is replayed[0].stats for s in replayed))
+        self.assertEqual(result.stats["steps"], searched)
+        self.assertEqual(result.stats["states"], replayed[0].stats["states"])
+
+    def test_on_stats(self):
+        state = shootme_fixture("solvedmin/2951.txt")
+        streamed = []
+        steps, result = self.collect(solve_iter(state, k=2, on_stats=streamed.append))
+        self.assertEqual(streamed[-1], result.stats)
+        self.assertEqual(streamed[0]["steps"], 1)
+
+    def test_cancel(self):
+        state = shootme_fixture("solvedmin/1238.txt")
+        steps = solve_iter(state, k=2, stats=True)
+        first = next(steps)
+        self.assertEqual(first.step, 1)
+        self.assertEqual(first.stats["steps"], 1)
+        self.assertIn("tableau", to_ui_state(first.state))
+        steps.close()
+        with self.assertRaises(StopIteration):
+            next(steps)
+
+
+class TestSolverStats(unittest.TestCase):
+    def test_solve_stats(self):
+        state = shootme_fixture("solvedmin/1238.txt")
+        streamed = []
+        result = solve(state, k=2, on_stats=streamed.append)
+        stats = result.stats
+        self.assertIsNone(solve(state, k=2).stats)
+        steps = [s["steps"] for s in streamed[:-1]]
+        self.assertEqual(steps, list(range(1, stats["steps"] + 1)))
+        self.assertEqual(streamed[-1], stats)
+        self.assertEqual(stats["steps"], result.visited)
+        self.assertGreater(stats["playouts"], 0)
+        self.assertGreaterEqual(stats["longest_playout"], stats["mean_playout"])
+        self.assertGreaterEqual(stats["states"], stats["playout_moves"])
+        self.assertGreater(stats["cache_hits"], 0)
+        self.assertGreater(stats["movegen_seconds"], 0)
+        self.assertLess(stats["scoring_seconds"], stats["seconds"])
+
+    def test_other_solvers_stats(self):
+        state = shootme_fixture("solvedmin/47.txt")
+        stats = solve_exhaustive(state, stats=True).stats
+        self.assertGreaterEqual(stats["hash_lookups"], stats["states"] - 1)
+        self.assertEqual(stats["playouts"], 0)
+        stats = solve_beam(state, beam_width=10, max_depth=5, stats=True).stats
+        self.assertEqual(stats["steps"], 5)
+        self.assertGreater(stats["legal_move_calls"], 5)
+        stats = solve_anytime(state, time_budget=60, stats=True).stats
+        self.assertGreater(stats["playouts"], 0)
+
+    def test_stats_left_as_found(self):
+        state = shootme_fixture("solvedmin/47.txt")
+        solve_beam(state, beam_width=10, max_depth=5, stats=True)
+        try:
+            self.assertFalse(enable_search_stats())
+            alone = solve_beam(state, beam_width=10, max_depth=5, stats=True).stats
+            before = search_stats()
+            stats = solve_beam(state, beam_width=10, max_depth=5, stats=True).stats
+            self.assertTrue(enable_search_stats())
+            # the caller's counts are kept, and the solve's are its own
+            self.assertEqual(search_stats().states, before.states + stats["states"])
+            self.assertEqual(stats["states"], alone["states"])
+        finally:
+            disable_search_stats()
+
+
+class TestExhaustiveSolver(unittest.TestCase):
+    def test_solves_seed_47(self):
+        state = shootme_fixture("solvedmin/47.txt")
+        result = solve_exhaustive(state)
+        self.assertEqual(result.msg, "Solved")
+        self.assertTrue(result.solved)
+        self.assertFalse(result.impossible)
+        self.assertTrue(validate_move_seq(state, result.moveseq))
+
+    def test_auto_foundation_moves_are_recorded(self):
+        state = shootme_fixture("solvedmin/47.txt")
+        enable_auto_foundation()
+        try:
+            result = solve_exhaustive(state)
+            greedy = solve(state, k=1)
+        finally:
+            disable_auto_foundation()
+        self.assertTrue(result.solved)
+        self.assertTrue(validate_move_seq(state, result.moveseq))
+        self.assertTrue(greedy.solved)
+        self.assertTrue(validate_move_seq(state, greedy.moveseq))
+
+    def test_proves_seed_2591_impossible(self):
+        result = solve_exhaustive(shootme_fixture("impossible/2591.txt"))
+        self.assertEqual(result.msg, "Impossible")
+        self.assertTrue(result.impossible)
+        self.assertFalse(result.solved)
+
+    def test_gives_up_at_node_limit(self):
+        result = solve_exhaustive(shootme_fixture("unknown/96.txt"), max_nodes=1000)
+        self.assertEqual(result.msg, "Unknown")
+        self.assertEqual(result.visited, 1000)
+        self.assertFalse(result.solved or result.impossible)
+
+    def test_gives_up_at_time_limit(self):
+        result = solve_exhaustive(
+            shootme_fixture("unknown/96.txt"), max_nodes=10 ** 9, max_seconds=0.1
+        )
+        self.assertEqual(result.msg, "Unknown")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,222 @@
+"""
+Runs a solver over a benchmark suite, streaming one JSONL record per deal.
+
+Each deal runs in its own forked process, `--workers` at a time, so that a
+deal can be killed after `--timeout` seconds: the solvers' C loops never
+return to Python, so an in-process alarm could not interrupt them.
+
+    python suite.py rollout -p k=2 --suite 10 --workers 8 --timeout 600
+"""
+import os
+import ast
+import json
+import time
+import argparse
+import platform
+import itertools
+import multiprocessing
+import multiprocessing.connection
+from datetime import datetime
+from benchmarking import get_seeds, get_state, get_suite_files, git_revision, solve_state
+from gamestate import shootme_deal
+from harvest import cache_path
+from solver import solve, solve_anytime, solve_beam, solve_exhaustive
+
+
+SOLVERS = {
+    "rollout": solve,
+    "anytime": solve_anytime,
+    "beam": solve_beam,
+    "exhaustive": solve_exhaustive,
+}
+
+
+def load_deals(seeds, corpus=None, generate=False):
+    """
+    (seed, state, ShootMe classification) of each seed; with `generate`, the
+    deals are generated without any ShootMe results, so unclassified
+    """
+    for seed in seeds:
+        if generate:
+            yield seed, shootme_deal(seed), None
+            continue
+        if corpus is not None:
+            yield seed, corpus.state(seed), corpus.classification(seed)
+            continue
+        with open(cache_path(seed)) as f:
+            ret = f.read()
+        yield seed, get_state(ret), solve_state(ret)
+
+
+def machine_info():
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def run_deal(solver, seed, state, params):
+    """ runs a solver on one deal and returns its result record """
+    start = time.time()
+    sol = SOLVERS[solver](state, **params)
+    elapsed = time.time() - start
+    moves = list(sol.moveseq) if sol.solved else None
+    return {
+        "seed": seed,
+        "time": elapsed,
+        "solved": sol.solved,
+        "impossible": sol.impossible,
+        "visited": sol.visited,
+        "msg": sol.msg,
+        "seq": " ".join(moves) if moves else None,
+        "seqlen": len(moves) if moves else -1,
+        "datetime": datetime.now().isoformat(),
+    }
+
+
+def _run_deal_in_child(conn, solver, seed, state, params):
+    try:
+        conn.send(run_deal(solver, seed, state, params))
+    except Exception as e:
+        conn.send({"seed": seed, "error": repr(e)})
+    conn.close()
+
+
+def run_deals(deals, solver, params, workers=None, timeout=None):
+    """
+    Runs `solver` on each (seed, state, shootme) deal, `workers` deals at a
+    time, each in its own process so that it can be killed after `timeout`
+    seconds. Yields result records in the order the deals finish.
+    """
+    ctx = multiprocessing.get_context("fork")
+    workers = workers or os.cpu_count()
+    deals = iter(deals)
+    running = {}  # connection -> (process, seed, shootme, start time)
+    try:
+        while True:
+            for seed, state, shootme in itertools.islice(deals, workers - len(running)):
+                recv, send = ctx.Pipe(duplex=False)
+                args = (send, solver, seed, state, params)
+                proc = ctx.Process(target=_run_deal_in_child, args=args, daemon=True)
+                proc.start()
+                send.close()
+                running[recv] = (proc, seed, shootme, time.time())
+            if not running:
+                return
+            wait_for = None
+            if timeout is not None:
+                oldest = min(start for _, _, _, start in running.values())
+                wait_for = max(0, oldest + timeout - time.time())
+            ready = multiprocessing.connection.wait(list(running), timeout=wait_for)
+            now = time.time()
+            for conn in list(running):
+                proc, seed, shootme, start = running[conn]
+                if conn in ready:
+                    try:
+                        record = conn.recv()
+                    except EOFError:  # the child died without a result
+                        record = {"seed": seed, "error": f"exit code {proc.exitcode}"}
+                elif timeout is not None and now - start >= timeout:
+                    proc.kill()
+                    record = {"seed": seed, "error": "timeout", "time": now - start}
+                else:
+                    continue
+                proc.join()
+                conn.close()
+                del running[conn]
+                record["shootme"] = shootme
+                yield record
+    finally:
+        for proc, _, _, _ in running.values():
+            proc.kill()
+            proc.join()
+
+
+def parse_param(text):
+    """ "name=value", the value being a Python literal or else a string """
+    name, _, value = text.partition("=")
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return name, value
+
+
+def timestr():
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a solver over a benchmark suite, writing JSONL results."
+    )
+    parser.add_argument("solver", choices=sorted(SOLVERS))
+    parser.add_argument(
+        "-p",
+        "--param",
+        action="append",
+        default=[],
+        type=parse_param,
+        metavar="NAME=VALUE",
+        help="solver keyword argument, eg. -p k=2 -p max_states=10000",
+    )
+    deals = parser.add_mutually_exclusive_group(required=True)
+    deals.add_argument("--suite", type=int, help="run every file in bench/suites/SIZE/")
+    deals.add_argument("--suite-file", action="append", help="a file of seeds")
+    deals.add_argument("--seeds", type=int, nargs="+")
+    sources = parser.add_mutually_exclusive_group()
+    sources.add_argument("--corpus", help="read deals from a packed corpus file")
+    sources.add_argument(
+        "--generate", action="store_true", help="generate the deals instead of reading them"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per deal")
+    parser.add_argument("-o", "--output", help="JSONL file (default under bench/results/)")
+    args = parser.parse_args(argv)
+
+    if args.suite is not None:
+        suite_files = get_suite_files(args.suite)
+    elif args.suite_file:
+        suite_files = args.suite_file
+    else:
+        suite_files = [None]
+    params = dict(args.param)
+    git = git_revision()
+    output = args.output
+    if output is None:
+        os.makedirs("./bench/results", exist_ok=True)
+        output = f"./bench/results/{args.solver}-{timestr()}-{git}.jsonl"
+    corpus = None
+    if args.corpus:
+        from corpus import Corpus
+
+        corpus = Corpus(args.corpus)
+
+    with open(output, "w") as out:
+        meta = {
+            "solver": args.solver,
+            "params": params,
+            "git": git,
+            "machine": machine_info(),
+            "datetime": datetime.now().isoformat(),
+            "timeout": args.timeout,
+        }
+        out.write(json.dumps({"meta": meta}) + "\n")
+        for suite_file in suite_files:
+            seeds = args.seeds if suite_file is None else get_seeds(suite_file)
+            suite = None if suite_file is None else os.path.basename(suite_file)
+            deals = load_deals(seeds, corpus, args.generate)
+            for record in run_deals(deals, args.solver, params, args.workers, args.timeout):
+                record["suite"] = suite
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                status = record.get("error") or ("solved" if record["solved"] else record["msg"])
+                print(f"{suite or '-'}  seed {record['seed']:6}  {status}", flush=True)
+    print(f"results in {output}")
+
+
+if __name__ == "__main__":
+    main()
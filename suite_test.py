@@ -0,0 +1,55 @@
+import os
+import json
+import tempfile
+import unittest
+from benchmarking import filename_to_klonstate
+from suite import *
+
+
+class TestSuiteRunner(unittest.TestCase):
+    def deals(self, seeds):
+        return [
+            (seed, filename_to_klonstate(f"./fixtures/shootme/{clf}/{seed}.txt"), clf)
+            for clf, seed in seeds
+        ]
+
+    def test_run_deals(self):
+        deals = self.deals([("solvedmin", 12), ("impossible", 2591)])
+        records = list(run_deals(deals, "rollout", {"k": 2}, workers=2))
+        by_seed = {r["seed"]: r for r in records}
+        assert by_seed[12]["solved"]
+        assert by_seed[12]["seqlen"] == len(by_seed[12]["seq"].split(" "))
+        assert not by_seed[2591]["solved"]
+        assert by_seed[2591]["shootme"] == "impossible"
+
+    def test_timeout(self):
+        deals = self.deals([("solvedmin", 12), ("impossible", 2591)])
+        params = {"max_nodes": 100_000_000}
+        records = list(run_deals(deals, "exhaustive", params, workers=1, timeout=0.2))
+        assert [r.get("error") for r in records] == ["timeout", None]
+
+    def test_main_writes_jsonl(self):
+        from corpus import pack_corpus
+
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus = os.path.join(tmp, "corpus")
+            pack_corpus("./fixtures/shootme", corpus)
+            output = os.path.join(tmp, "out.jsonl")
+            argv = ["beam", "-p", "beam_width=5", "--seeds", "12", "2591"]
+            main(argv + ["--corpus", corpus, "-o", output, "--workers", "2"])
+            with open(output) as f:
+                lines = [json.loads(line) for line in f]
+        meta = lines[0]["meta"]
+        assert meta["solver"] == "beam"
+        assert meta["params"] == {"beam_width": 5}
+        assert "cpus" in meta["machine"]
+        assert sorted(r["seed"] for r in lines[1:]) == [12, 2591]
+
+    def test_load_generated_deals(self):
+        ((seed, state, shootme),) = load_deals([12], generate=True)
+        assert state == filename_to_klonstate("./fixtures/shootme/solvedmin/12.txt")
+        assert shootme is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,6 +8,7 @@ from tuplestate import (
 )
 import numpy as np
 import unittest
+import pickle
 import json
 
 
@@ -471,6 +472,27 @@ class TestState(unittest.TestCase):
         self.assertEqual(play_move(state, "DR9").waste[-1], "2D")
         self.assertEqual(play_move(state, "DR14").waste[-1], "7H")
 
+    def test_draw_moves_match_drawing_one_at_a_time(self):
+        for stock_len in range(len(self.state.stock) + 1):
+            state = self.state._replace(
+                stock=self.state.stock[:stock_len],
+                waste=self.state.stock[stock_len:][::-1],
+            )
+            st = state
+            tops = [st.waste[-3:]] if st.waste else []
+            for n in range(1, 30):
+                st = play_move(st, "DR1")
+                self.assertEqual(play_move(state, f"DR{n}"), st)
+                self.assertEqual(
+                    play_move(pack_state(state), f"DR{n}").to_klonstate(), st
+                )
+                tops.append(st.waste[-3:])
+            # draw moves stop at the first repeated waste
+            first_repeat = next(i for i in range(len(tops)) if tops[i] in tops[:i])
+            num_draws = first_repeat - (1 if state.waste else 0)
+            draws = {m for m in get_legal_moves(state) if m.startswith("DR")}
+            self.assertEqual(draws, {f"DR{n}" for n in irange(1, num_draws)})
+
     def test_state_equality(self):
         state1 = copy(self.state)
         moves = get_legal_moves(state1)
@@ -495,6 +517,25 @@ class TestState(unittest.TestCase):
         self.assertNotEqual(hash(state1), hash(draw(state1)))
         self.assertNotEqual(hash(state1), hash(draw(state3)))
 
+    def test_packed_state_hashing(self):
+        state1 = pack_state(self.state)
+        moves = get_legal_moves(state1)
+        draws = [m for m in moves if m.startswith("DR")]
+        highest_draw = max(draws, key=lambda dr: int(dr[2:]))
+        state2 = play_move(state1, highest_draw)
+        state3 = replace_stock(draw(state2))
+        self.assertEqual(state_hash(state1), state_hash(state3))
+        self.assertEqual(hash(state1), hash(state3))
+        self.assertNotEqual(state_hash(state1), state_hash(draw(state1)))
+        self.assertEqual(state_hash(self.state), state_hash(state1))
+
+    def test_packed_hash_is_incremental(self):
+        state = pack_state(self.state)
+        for move_code in ["DR3", "W3", "43", "14", "NEW", "DR8", "5C", "31-4"]:
+            state = play_move(state, move_code)
+            # same hash as hashing the resulting position from scratch
+            self.assertEqual(state.zhash, state_hash(unpack_state(state)))
+
     def test_state_is_win(self):
         d = {
             # fmt: off
@@ -1241,12 +1282,276 @@ class TestState(unittest.TestCase):
         )
         self.assertFalse(state_is_legal(state))
 
+    ###### Packed states
+
+    def test_pack_state_roundtrip(self):
+        packed = pack_state(self.state)
+        self.assertEqual(unpack_state(packed), self.state)
+        self.assertEqual(packed.stock, self.state.stock)
+        self.assertEqual(packed[TABLEAU7], self.state[TABLEAU7])
+        self.assertEqual(to_pretty_string(packed), to_pretty_string(self.state))
+        self.assertEqual(PackedState.from_bytes(packed.to_bytes()), packed)
+        self.assertEqual(pickle.loads(pickle.dumps(packed)), packed)
+
+    def test_pack_state_rejects_bad_cards(self):
+        state = self.state._replace(waste=("XX",))
+        with self.assertRaises(ValueError):
+            pack_state(state)
+
+    def test_packed_draw_and_move(self):
+        packed = pack_state(self.state)
+        state = self.state
+        for _ in range(3):
+            state, packed = draw(state), draw(packed)
+        state = move(state, WASTE, TABLEAU3)
+        packed = move(packed, WASTE, TABLEAU3)
+        self.assertEqual(packed.waste, state.waste)
+        self.assertEqual(packed.to_klonstate(), state)
+        while len(state.stock) > 0:
+            state, packed = draw(state), draw(packed)
+        state, packed = replace_stock(state), replace_stock(packed)
+        self.assertEqual(packed.to_klonstate(), state)
+
+    def test_packed_legal_moves(self):
+        packed = pack_state(self.state)
+        self.assertEqual(get_legal_moves(packed), get_legal_moves(self.state))
+        for move_code in get_legal_moves(self.state):
+            expected = play_move(self.state, move_code)
+            actual = play_move(packed, move_code)
+            self.assertIsInstance(actual, PackedState)
+            self.assertEqual(actual.to_klonstate(), expected)
+            self.assertEqual(get_legal_moves(actual), get_legal_moves(expected))
+
+    def test_packed_entire_game(self):
+        soln = (
+            "5C F5 5C F5 DR3 W5 45 F4 41 F4 DR1 W4 74 F7 DR3 W7 WC DR1 NEW DR2 W1 "
+            "W6 WS DR3 W4 WC 74-2 F7 61-2 F6 67 F6 61 F6 6S F6 1S W4 64 F6 6S W6 WD "
+            "15-5 W1 W6 36 F3 W7 WH WD DR1 W1 31 F3 3S 4S WS 71-3 F7 W1 43-7 F4 4H "
+            "W6 WH 5H 5C 2C F2 2D 7D F7 7D F7 7D F7 7H 5H 1H 3D 5C 1S 3C 5H 5S 3H "
+            "5H DR1 W2 WC 3C 5C F5 5D F5 1D 1S 6D 1D 3H 6S 1C 3S 5H 6D 1H 2C 3D 6S"
+        ).split(" ")
+        state = self.state
+        packed = pack_state(state)
+        for move_code in soln:
+            self.assertFalse(state_is_win(packed))
+            state = play_move(state, move_code)
+            packed = play_move(packed, move_code)
+            self.assertEqual(packed.to_klonstate(), state)
+        self.assertTrue(state_is_win(packed))
+
+    def test_move_ids_match_vectorized_moves(self):
+        self.assertEqual(list(MOVE_CODES[: len(all_moves)]), all_moves)
+        for i, code in enumerate(MOVE_CODES):
+            self.assertEqual(move_id(code), i)
+            self.assertEqual(move_code(i), code)
+        self.assertEqual(move_info(move_id("37-2")), (MOVE_TABLEAU, 3, 7, 2))
+        self.assertEqual(move_info(move_id("DR4")), (MOVE_DRAW, 0, 8, 4))
+        with self.assertRaises(ValueError):
+            move_id("DR0")
+
+    def test_legal_move_ids(self):
+        soln = "5C F5 5C F5 DR3 W5 45 F4 41 F4 DR1 W4 74 F7 DR3 W7 WC DR1 NEW".split()
+        state = self.state
+        for code in soln:
+            ids = get_legal_moves_ids(state)
+            self.assertEqual(list(ids), sorted(ids))
+            self.assertEqual({move_code(i) for i in ids}, get_legal_moves(state))
+            for i in ids:
+                next_state = play_move(state, move_code(i))
+                self.assertEqual(play_move_id(state, i), next_state)
+                packed = play_move_id(pack_state(state), i)
+                self.assertEqual(packed.to_klonstate(), next_state)
+            state = play_move(state, code)
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # "b" is now least recently used
+        cache.put("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.info(), CacheInfo(2, 1, 2, 2))
+        with self.assertRaises(ValueError):
+            LRUCache(maxsize=0)
+
+    def test_legal_move_cache(self):
+        expected = get_legal_moves(self.state)
+        self.assertIsNone(legal_move_cache_info())
+        enable_legal_move_cache(maxsize=10)
+        try:
+            for _ in range(3):
+                self.assertEqual(get_legal_moves(self.state), expected)
+            info = legal_move_cache_info()
+            self.assertEqual((info.hits, info.misses, info.currsize), (2, 1, 1))
+        finally:
+            disable_legal_move_cache()
+        self.assertIsNone(legal_move_cache_info())
+
+    def test_search_state_do_and_undo(self):
+        soln = "5C F5 5C F5 DR3 W5 45 F4 41 F4 DR1 W4 74 F7 DR3 W7 WC DR1".split()
+        search = SearchState(self.state)
+        states = [self.state]
+        for code in soln:
+            if code.startswith("F"):
+                continue
+            search.do_move(move_id(code))
+            states.append(play_move(states[-1], code))
+            self.assertEqual(search.snapshot(), states[-1])
+            self.assertEqual(state_hash(search), state_hash(states[-1]))
+        self.assertEqual(len(search.moves), len(states) - 1)
+        while search.num_moves > 0:
+            search.undo_move()
+            states.pop()
+            self.assertEqual(search.snapshot(), states[-1])
+            self.assertEqual(search.zhash, state_hash(states[-1]))
+        with self.assertRaises(IndexError):
+            search.undo_move()
+        # snapshots don't follow later moves
+        packed = pack_state(search)
+        search.do_move(move_id("5C"))
+        self.assertEqual(packed.to_klonstate(), self.state)
+        self.assertEqual(search.packed(), play_move(packed, "5C"))
+
+    def test_packed_dead_end(self):
+        stockstr = (
+            "TS,5C,QC,2H,3D,6C,AC,2C,5S,4H,4S,JH,TC,6S,AD,7C,KH,6D,KD,3H,8C,9H,9C"
+        )
+        d = {
+            "foundations": [(), (), (), ()],
+            "stock": reversed(stockstr.split(",")),
+            "waste": (),
+            "tableau": [
+                ("KC",),
+                ("2d", "3C"),
+                ("8s", "2s", "5D", "4C"),
+                ("8d", "7h", "qd", "JD"),
+                ("7d", "4d", "8h", "QH", "JS"),
+                ("ks", "as", "ah", "7s", "9s", "QS"),
+                ("5h", "3s", "9d", "jc", "6h", "th", "TD"),
+            ],
+        }
+        packed = play_move(pack_state(init_from_dict(d)), "75")
+        self.assertTrue(state_is_dead_end(packed))
+        win = self.state._replace(
+            stock=(),
+            **{f"tableau{t}": () for t in irange(1, 7)},
+            **{f"foundation{f + 1}": tuple(r + s for r in "A23456789TJQK")
+               for f, s in enumerate("CDSH")},
+        )
+        self.assertFalse(state_is_dead_end(pack_state(win)))
+
+    def test_dead_end_pruning(self):
+        stockstr = (
+            "TS,5C,QC,2H,3D,6C,AC,2C,5S,4H,4S,JH,TC,6S,AD,7C,KH,6D,KD,3H,8C,9H,9C"
+        )
+        d = {
+            "foundations": [(), (), (), ()],
+            "stock": reversed(stockstr.split(",")),
+            "waste": (),
+            "tableau": [
+                ("KC",),
+                ("2d", "3C"),
+                ("8s", "2s", "5D", "4C"),
+                ("8d", "7h", "qd", "JD"),
+                ("7d", "4d", "8h", "QH", "JS"),
+                ("ks", "as", "ah", "7s", "9s", "QS"),
+                ("5h", "3s", "9d", "jc", "6h", "th", "TD"),
+            ],
+        }
+        dead = play_move(pack_state(init_from_dict(d)), "75")
+        moves = get_legal_moves_ids(dead)
+        expected = get_legal_moves_ids(self.state)
+        enable_dead_end_pruning()
+        try:
+            self.assertEqual(get_legal_moves_ids(dead), ())
+            self.assertEqual(get_legal_moves(dead), set())
+            self.assertEqual(SearchState(dead).legal_moves(), ())
+            self.assertEqual(get_legal_moves_ids(self.state), expected)
+            self.assertEqual(dead_end_info(), (4, 3, 3 * len(moves)))
+            self.assertEqual(vector_legal_moves(dead).sum(), len(moves))
+        finally:
+            disable_dead_end_pruning()
+        self.assertEqual(get_legal_moves_ids(dead), moves)
+
+    def test_auto_foundation(self):
+        ranks = "A23456789TJQK"
+        rest = [r + s for s in "cdsh" for r in ranks[3:].lower()]
+        rest = [card for card in rest if card not in ("kc", "4s")]
+        d = {
+            "foundations": [("AC", "2C", "3C"), ("AD",), ("AS", "2S"), ("AH", "2H")],
+            "stock": ["3D", "2D"],
+            "waste": ["3S"],
+            "tableau": [("3H",), ("KC",), ("4S",)] + [rest[i::4] for i in range(4)],
+        }
+        state = pack_state(init_from_dict(d))
+        moves = {move_code(m) for m in get_legal_moves_ids(state)}
+        self.assertTrue({"1H", "WS", "13"} <= moves)
+        enable_auto_foundation()
+        try:
+            # the 3H is safe: the 2C, 2S and AD are up
+            self.assertEqual(get_legal_moves(state), {"1H"})
+            # the 3S is not: the 2D is down
+            d["tableau"][0] = ()
+            moves = get_legal_moves(init_from_dict(d))
+            self.assertIn("WS", moves)
+            self.assertGreater(len(moves), 1)
+            d["foundations"][1] = ("AD", "2D")
+            d["stock"] = ["3D"]
+            self.assertEqual(get_legal_moves(init_from_dict(d)), {"WS"})
+        finally:
+            disable_auto_foundation()
+        self.assertIn("13", get_legal_moves(state))
+
+    ###### ShootMe deals
+
+    def test_shootme_deal(self):
+        with open("./fixtures/sm-seed12.json") as f:
+            expected = init_from_solvitaire(json.load(f))
+        self.assertEqual(shootme_deal(12), expected)
+        packed = shootme_deal(12, packed=True)
+        self.assertIsInstance(packed, PackedState)
+        self.assertEqual(packed, pack_state(expected))
+        self.assertEqual(state_hash(packed), state_hash(expected))
+        self.assertTrue(state_is_legal(shootme_deal(-1)))
+
+    def test_shootme_deals(self):
+        deals = list(shootme_deals(10, 15))
+        self.assertEqual([seed for seed, _ in deals], list(range(10, 15)))
+        self.assertEqual(deals[2][1], shootme_deal(12))
+        packed = [deal for _, deal in shootme_deals(10, 15, packed=True)]
+        self.assertEqual(packed, [pack_state(deal) for _, deal in deals])
+
     ###### Vectorizing
 
     def test_state_to_vec_is_an_array_of_expected_size(self):
         vec = state_to_vec(self.state)
         self.assertEqual(vec.shape, (233, 104))
 
+    def test_states_to_vec_batch(self):
+        states = [self.state, pack_state(play_move(self.state, "DR3"))]
+        vecs = states_to_vec(states)
+        self.assertEqual(vecs.shape, (2, 233, 104))
+        self.assertEqual(vecs.dtype, np.float32)
+        for state, vec in zip(states, vecs):
+            piles = [pile_to_vec(state, p) for p in range(STOCK, FOUNDATION_H + 1)]
+            self.assertTrue(np.array_equal(vec, np.concatenate(piles)))
+        out = np.ones((2, 233, 104), dtype=np.float64)
+        self.assertIs(states_to_vec(states, out=out), out)
+        self.assertTrue(np.array_equal(out, vecs))
+
+    def test_states_to_vec_sparse(self):
+        indices = states_to_vec([self.state], sparse=True)
+        self.assertEqual(indices.shape, (1, 233))
+        self.assertEqual(all_cards[indices[0, 0]], "KC")  # bottom of the stock
+        self.assertEqual(indices[0, 24], CARD_INDEX["8H"])  # tableau 1
+        self.assertEqual(indices[0, 25], PAD_INDEX)
+        self.assertEqual((indices[0] < PAD_INDEX).sum(), 52)
+        dense = states_to_vec([self.state])[0]
+        self.assertTrue(np.array_equal(dense.argmax(axis=1)[dense.any(axis=1)],
+                                       indices[0][indices[0] < PAD_INDEX]))
+
     def test_state_to_vec_inversion_1(self):
         transformed = vec_to_state(state_to_vec(self.state))
         self.assertEqual(transformed, self.state)
@@ -1270,6 +1575,21 @@ class TestState(unittest.TestCase):
         transformed = vec_to_state(state_to_vec(state))
         self.assertEqual(transformed, state)
 
+    def test_vecs_to_states_batch(self):
+        states = [self.state, play_move(self.state, "5C"), play_move(self.state, "DR4")]
+        vecs = states_to_vec(states)
+        self.assertEqual(vecs_to_states(vecs), states)
+        sparse = states_to_vec(states, sparse=True)
+        packed = vecs_to_states(sparse, packed=True)
+        self.assertEqual([p.to_klonstate() for p in packed], states)
+        self.assertEqual(list(face_down_counts(vecs)), [21, 20, 21])
+        self.assertEqual(list(face_up_counts(sparse)), [31, 32, 31])
+        self.assertEqual(foundation_counts(vecs).tolist(), [[0] * 4, [1, 0, 0, 0], [0] * 4])
+        bad = sparse.copy()
+        bad[0, 0] = 200
+        with self.assertRaises(ValueError):
+            vecs_to_states(bad)
+
     def test_vector_legal_moves(self):
         state = KlonState(
             # fmt: off
@@ -1328,6 +1648,20 @@ class TestState(unittest.TestCase):
         # assert the reference moves vector has the expected size
         self.assertEqual(actual.shape, (623,))
 
+    def test_legal_move_mask_batch(self):
+        states = [self.state, pack_state(play_move(self.state, "DR2"))]
+        out = np.full((3, len(all_moves)), 7, dtype=np.uint8)
+        masks = legal_move_mask_batch(states, out=out)
+        self.assertIs(masks, out)
+        for state, mask in zip(states, masks):
+            expected = np.isin(np_all_moves, list(get_legal_moves(state)))
+            self.assertTrue(np.array_equal(mask, expected.astype(np.uint8)))
+            self.assertTrue(np.array_equal(
+                vectorize_legal_moves(get_legal_moves(state)), mask
+            ))
+        self.assertTrue((out[2] == 7).all())  # rows past the batch are untouched
+        self.assertEqual(legal_move_mask_batch([]).shape, (0, 623))
+
     def test_to_pretty_string(self):
         game = {
             "foundation": [
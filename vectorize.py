@@ -1,5 +1,11 @@
 import numpy as np
-from gamestate import KlonState, get_legal_moves
+from gamestate import (
+    KlonState,
+    MOVE_IDS,
+    fill_card_indices,
+    fill_legal_move_masks,
+    unpack_card_indices,
+)
 
 STOCK = 0
 TABLEAU1 = 1
@@ -77,11 +83,16 @@ def generate_all_possible_cards():
 
 
 all_cards = generate_all_possible_cards()
+CARD_INDEX = {card: i for i, card in enumerate(all_cards)}
+# card index of an empty slot in sparse state vectors
+PAD_INDEX = len(all_cards)
+VEC_ROWS = sum(PAD.values())  # 233
 
 
 def card_to_vec(card):
-    ret = (all_cards == card).astype(np.float32)
-    assert ret.max() == 1, "invalid card provided"
+    assert card in CARD_INDEX, "invalid card provided"
+    ret = np.zeros(len(all_cards), dtype=np.float32)
+    ret[CARD_INDEX[card]] = 1
     return ret
 
 
@@ -95,26 +106,73 @@ def pile_to_vec(klonstate, pile_idx):
 
 
 def state_to_vec(klonstate):
-    piles = range(STOCK, FOUNDATION_H + 1)
-    pilevecs = [pile_to_vec(klonstate, p) for p in piles]
-    return np.concatenate(pilevecs)
+    return states_to_vec([klonstate], dtype=np.float64)[0]
+
+
+def states_to_vec(states, out=None, dtype=np.float32, sparse=False):
+    """
+    Batched state_to_vec: a one-hot array [len(states), 233, 104].
+    sparse: instead return the int16 array [len(states), 233] of card
+        indices into all_cards, PAD_INDEX marking empty slots
+    out: optional preallocated array to fill
+    """
+    if sparse:
+        if out is None:
+            out = np.empty((len(states), VEC_ROWS), dtype=np.int16)
+        fill_card_indices(states, out, PAD_INDEX)
+        return out
+    indices = states_to_vec(states, sparse=True)
+    if out is None:
+        out = np.zeros((len(states), VEC_ROWS, len(all_cards)), dtype=dtype)
+    else:
+        out[: len(states)] = 0
+    state_idx, row = np.nonzero(indices < PAD_INDEX)
+    out[state_idx, row, indices[state_idx, row]] = 1
+    return out
 
 
 def vec_to_state(statevec):
-    piles = range(STOCK, FOUNDATION_H + 1)
-    klonpiles = []
-    start = 0
-    for pile_idx in piles:
-        end = start + PAD[pile_idx]
-        pilevec = statevec[start:end]
-        cardmsk = pilevec.max(axis=1) == 1
-        if not cardmsk.any():
-            klonpiles.append(())
-        else:
-            pile_cards = all_cards[np.argmax(pilevec[cardmsk], axis=1)]
-            klonpiles.append(tuple(pile_cards))
-        start = end
-    return KlonState(*klonpiles)
+    return vecs_to_states(statevec[np.newaxis])[0]
+
+
+def vecs_to_indices(vecs):
+    """
+    vecs: [N, 233, 104] state vectors, or [N, 233] card indices (sparse)
+    returns the int16 card indices [N, 233] (as states_to_vec(sparse=True))
+    """
+    vecs = np.asarray(vecs)
+    if vecs.ndim == 3:
+        occupied = vecs.max(axis=2) == 1
+        vecs = np.where(occupied, vecs.argmax(axis=2), PAD_INDEX)
+    return np.ascontiguousarray(vecs, dtype=np.int16)
+
+
+def vecs_to_states(vecs, packed=False):
+    """
+    Batched vec_to_state, taking dense or sparse vectors (see vecs_to_indices)
+    packed: return PackedStates rather than KlonStates
+    """
+    states = unpack_card_indices(vecs_to_indices(vecs), PAD_INDEX)
+    if packed:
+        return states
+    return [s.to_klonstate() for s in states]
+
+
+def face_down_counts(vecs):
+    """ number of face-down cards in each state """
+    indices = vecs_to_indices(vecs)
+    return ((indices >= len(all_cards) // 2) & (indices < PAD_INDEX)).sum(axis=1)
+
+
+def face_up_counts(vecs):
+    """ number of face-up cards in each state """
+    return (vecs_to_indices(vecs) < len(all_cards) // 2).sum(axis=1)
+
+
+def foundation_counts(vecs):
+    """ [N, 4] number of cards on each foundation (C, D, S, H) of each state """
+    indices = vecs_to_indices(vecs)[:, -4 * PAD[FOUNDATION_C] :]
+    return (indices < PAD_INDEX).reshape(len(indices), 4, -1).sum(axis=2)
 
 
 # first generate all possible moves
@@ -183,10 +241,25 @@ np_all_moves = np.array(all_moves)
 
 
 def vectorize_legal_moves(legal_move_set):
-    moves = list(legal_move_set)
-    return np.isin(np_all_moves, moves).astype(np.uint8)
+    vec = np.zeros(len(all_moves), dtype=np.uint8)
+    for move in legal_move_set:
+        # move ids index all_moves (see gamestate.MOVE_CODES)
+        idx = MOVE_IDS.get(move)
+        if idx is not None and idx < len(vec):
+            vec[idx] = 1
+    return vec
+
+
+def legal_move_mask_batch(states, out=None):
+    """
+    uint8 array [len(states), 623]: 1 where a move of all_moves is legal
+    out: optional preallocated array to fill
+    """
+    if out is None:
+        out = np.empty((len(states), len(all_moves)), dtype=np.uint8)
+    fill_legal_move_masks(states, out)
+    return out
 
 
 def vector_legal_moves(state):
-    moves = list(get_legal_moves(state))
-    return np.isin(np_all_moves, moves).astype(np.uint8)
+    return legal_move_mask_batch([state])[0]